@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Offline Batch-Throughput Benchmark for vLLM
+Sends list-of-prompt /v1/completions requests for bulk jobs (summarization,
+classification) where only aggregate tokens/sec matters.
+Reads the prompt file lazily, writes outputs incrementally and resumes
+after interruption.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+from load_test_utils import create_session, parse_retry_after
+
+# Configuration
+SERVER_HOST = "192.168.1.1"
+SERVER_PORT = "80"
+MODEL_ID = None  # first model from /v1/models unless --model is given
+
+BATCH_SIZES = [1, 8, 32]
+CONCURRENCY = 4          # batch requests in flight at once
+MAX_TOKENS = 256
+REQUEST_TIMEOUT = 600    # matches proxy_read_timeout in nginx.conf
+MAX_RETRIES = 3
+GPU_HOURLY_COST = 2.0    # USD per GPU-hour, for cost per 1M tokens
+NUM_GPUS = 8             # one per backend in vllm_backends.conf
+
+
+def read_prompts(path):
+    """Lazily yield (index, prompt) from a text file (one prompt per line) or JSONL ({"prompt": ...})"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if line.lstrip().startswith('{'):
+                try:
+                    record = json.loads(line)
+                    line = record.get('prompt') or record.get('text') or ''
+                except json.JSONDecodeError:
+                    pass
+            if line:
+                yield index, line
+
+
+def load_completed(output_path):
+    """Prompt indices already written by an earlier (possibly interrupted) run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    # Drop a partial last line from an interrupted write so new records
+    # are appended on a line of their own
+    with open(output_path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(pos, 65536)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b'\n')
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < end:
+            f.truncate(pos)
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['index'])
+            except (json.JSONDecodeError, KeyError):
+                continue  # partial last line from an interrupted write
+    return done
+
+
+def batched(prompts, batch_size, skip):
+    """Group (index, prompt) pairs into lists of batch_size, skipping completed indices"""
+    batch = []
+    for index, prompt in prompts:
+        if index in skip:
+            continue
+        batch.append((index, prompt))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BatchStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.failed_batches = 0
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+
+    def record_batch(self, size, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.batches += 1
+            self.prompts += size
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def record_failed(self):
+        with self.lock:
+            self.failed_batches += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def summary(self, elapsed, gpu_hourly_cost, num_gpus):
+        with self.lock:
+            total_tokens = self.prompt_tokens + self.completion_tokens
+            run_cost = gpu_hourly_cost * num_gpus * elapsed / 3600
+            return {
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'retries': self.retries,
+                'prompts': self.prompts,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'elapsed': elapsed,
+                'prompts_per_sec': self.prompts / elapsed if elapsed > 0 else 0,
+                'output_tps': self.completion_tokens / elapsed if elapsed > 0 else 0,
+                'total_tps': total_tokens / elapsed if elapsed > 0 else 0,
+                'run_cost': run_cost,
+                'cost_per_1m_total': run_cost / total_tokens * 1e6 if total_tokens > 0 else 0,
+                'cost_per_1m_output': run_cost / self.completion_tokens * 1e6 if self.completion_tokens > 0 else 0
+            }
+
+
+def send_batch(session, base_url, model, batch, max_tokens, temperature, stats):
+    """POST one list-of-prompt completion request; returns (choices by position, usage) or None"""
+    payload = {
+        "model": model,
+        "prompt": [prompt for _, prompt in batch],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": False
+    }
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            r = session.post(f"{base_url}/v1/completions", json=payload, timeout=REQUEST_TIMEOUT)
+            if r.status_code == 200:
+                data = r.json()
+                choices = sorted(data.get('choices') or [], key=lambda c: c.get('index', 0))
+                return choices, data.get('usage') or {}
+            if r.status_code == 429:
+                delay = parse_retry_after(r.headers.get('Retry-After'))
+            else:
+                print(f"  HTTP {r.status_code}: {r.text[:200]}")
+                delay = 2 ** attempt
+        except Exception as e:
+            print(f"  Error: {str(e)[:200]}")
+            delay = 2 ** attempt
+        if attempt < MAX_RETRIES:
+            stats.record_retry()
+            time.sleep(delay)
+    return None
+
+
+def run_batch_size(base_url, model, prompt_file, batch_size, args):
+    """Process the prompt file at one batch size and return its summary"""
+    output_path = os.path.join(args.output_dir, f"outputs_bs{batch_size}.jsonl")
+    done = load_completed(output_path)
+    if done:
+        print(f"↻ Resuming batch size {batch_size}: {len(done)} prompts already in {output_path}")
+
+    stats = BatchStats()
+    write_lock = threading.Lock()
+    # Bounded queue keeps the reader at most a few batches ahead of the workers
+    work = queue.Queue(maxsize=args.concurrency * 2)
+
+    def worker():
+        session = create_session()
+        while True:
+            batch = work.get()
+            if batch is None:
+                break
+            result = send_batch(session, base_url, model, batch, args.max_tokens, args.temperature, stats)
+            if result is None:
+                # Left out of the output file, so a resumed run retries it
+                stats.record_failed()
+                print(f"  ✗ Batch starting at prompt {batch[0][0]} failed after {MAX_RETRIES} retries")
+                continue
+            choices, usage = result
+            if len(choices) != len(batch):
+                stats.record_failed()
+                print(f"  ✗ Batch starting at prompt {batch[0][0]}: {len(choices)} choices for {len(batch)} prompts")
+                continue
+            with write_lock:
+                with open(output_path, 'a', encoding='utf-8') as f:
+                    for (index, prompt), choice in zip(batch, choices):
+                        f.write(json.dumps({
+                            'index': index,
+                            'text': choice.get('text', ''),
+                            'finish_reason': choice.get('finish_reason')
+                        }, ensure_ascii=False) + "\n")
+                    f.flush()
+            stats.record_batch(len(batch), usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        session.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+
+    start = time.time()
+    last_report = start
+    submitted = 0
+    for batch in batched(read_prompts(prompt_file), batch_size, done):
+        if args.limit and submitted >= args.limit:
+            break
+        if args.limit:
+            batch = batch[:args.limit - submitted]
+        work.put(batch)
+        submitted += len(batch)
+        if time.time() - last_report >= 15:
+            last_report = time.time()
+            s = stats.summary(last_report - start, args.gpu_hourly_cost, args.gpus)
+            print(f"  [bs={batch_size}] {s['prompts']} prompts done, {s['output_tps']:.0f} output tok/s")
+
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+
+    return stats.summary(time.time() - start, args.gpu_hourly_cost, args.gpus)
+
+
+def get_first_model(base_url):
+    try:
+        r = create_session().get(f"{base_url}/v1/models", timeout=10)
+        if r.status_code == 200:
+            models = r.json().get('data') or []
+            if models:
+                return models[0].get('id')
+    except Exception as e:
+        print(f"❌ Cannot connect to server: {e}")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline batch-throughput benchmark using batched /v1/completions')
+    parser.add_argument('--prompts', type=str, required=True, help='Prompt file: one prompt per line, or JSONL with a "prompt" field')
+    parser.add_argument('--output-dir', type=str, default='batch_outputs', help='Directory for outputs and summary')
+    parser.add_argument('--server', type=str, default=SERVER_HOST, help='Server IP')
+    parser.add_argument('--port', type=str, default=SERVER_PORT, help='Server port')
+    parser.add_argument('--model', type=str, default=MODEL_ID, help='Model ID (default: first from /v1/models)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES, help='Prompts per request; one run per value')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='Batch requests in flight at once')
+    parser.add_argument('--max-tokens', type=int, default=MAX_TOKENS, help='max_tokens per prompt')
+    parser.add_argument('--temperature', type=float, default=0.0, help='Sampling temperature')
+    parser.add_argument('--limit', type=int, default=0, help='Only process this many (remaining) prompts per batch size')
+    parser.add_argument('--gpu-hourly-cost', type=float, default=GPU_HOURLY_COST, help='USD per GPU-hour')
+    parser.add_argument('--gpus', type=int, default=NUM_GPUS, help='GPUs serving the run')
+
+    args = parser.parse_args()
+
+    if args.port and args.port != "80":
+        base_url = f"http://{args.server}:{args.port}"
+    else:
+        base_url = f"http://{args.server}"
+
+    if not os.path.exists(args.prompts):
+        print(f"❌ Prompt file not found: {args.prompts}")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    model = args.model or get_first_model(base_url)
+    if not model:
+        print("❌ Could not determine model (use --model)")
+        sys.exit(1)
+
+    print(f"\n{'='*70}")
+    print(f"vLLM BATCH THROUGHPUT BENCHMARK")
+    print(f"{'='*70}")
+    print(f"Server:        {base_url}")
+    print(f"Model:         {model}")
+    print(f"Prompt File:   {args.prompts}")
+    print(f"Batch Sizes:   {', '.join(str(b) for b in args.batch_sizes)}")
+    print(f"Concurrency:   {args.concurrency}")
+    print(f"Max Tokens:    {args.max_tokens}")
+    print(f"Cost Model:    {args.gpus} GPU(s) x ${args.gpu_hourly_cost:.2f}/h")
+    print(f"Output Dir:    {os.path.abspath(args.output_dir)}")
+    print(f"{'='*70}\n")
+
+    results = []
+    for batch_size in args.batch_sizes:
+        print(f"▶ Batch size {batch_size} ({datetime.now().strftime('%H:%M:%S')})")
+        s = run_batch_size(base_url, model, args.prompts, batch_size, args)
+        results.append((batch_size, s))
+        print(f"  ✓ {s['prompts']} prompts in {s['elapsed']:.1f}s - {s['output_tps']:.0f} output tok/s - "
+              f"${s['cost_per_1m_total']:.3f}/1M tokens\n")
+
+    summary_path = os.path.join(args.output_dir, "batch_summary.csv")
+    with open(summary_path, 'a', encoding='utf-8') as f:
+        if f.tell() == 0:
+            f.write("timestamp,batch_size,concurrency,prompts,failed_batches,elapsed_s,prompts_per_s,"
+                    "prompt_tokens,completion_tokens,output_tok_s,total_tok_s,cost_usd,cost_per_1m_total,cost_per_1m_output\n")
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for batch_size, s in results:
+            f.write(f"{stamp},{batch_size},{args.concurrency},{s['prompts']},{s['failed_batches']},{s['elapsed']:.1f},"
+                    f"{s['prompts_per_sec']:.2f},{s['prompt_tokens']},{s['completion_tokens']},{s['output_tps']:.1f},"
+                    f"{s['total_tps']:.1f},{s['run_cost']:.4f},{s['cost_per_1m_total']:.4f},{s['cost_per_1m_output']:.4f}\n")
+
+    print(f"{'='*70}")
+    print(f"FINAL RESULTS")
+    print(f"{'='*70}")
+    print(f"{'Batch':>6}{'Prompts':>9}{'Failed':>8}{'Time':>9}{'Prompt/s':>10}{'Out tok/s':>11}{'Tot tok/s':>11}{'$/1M tot':>10}{'$/1M out':>10}")
+    for batch_size, s in results:
+        print(f"{batch_size:>6}{s['prompts']:>9}{s['failed_batches']:>8}{s['elapsed']:>8.1f}s{s['prompts_per_sec']:>10.2f}"
+              f"{s['output_tps']:>11.0f}{s['total_tps']:>11.0f}{s['cost_per_1m_total']:>10.3f}{s['cost_per_1m_output']:>10.3f}")
+    print(f"{'='*70}")
+    print(f"\nOutputs saved to: {os.path.abspath(args.output_dir)}")
+    print(f"Summary CSV:      {os.path.abspath(summary_path)}")
+    print(f"{'='*70}\n")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nBenchmark interrupted - rerun the same command to resume")
+        sys.exit(0)
@@ -14,6 +14,11 @@ import random
 import sys
 import socket
 import os
+from collections import defaultdict
+
+from load_test_utils import (SLO_TPOT, SLO_TTFT, PhaseTimer, ServerMetricsSampler, SLOTracker, create_session,
+                             format_phases, parse_retry_after, print_phase_breakdown, print_slo_report,
+                             summarize_phases, write_slo_timeseries)
 
 # Configuration
 SERVER_HOST = "192.168.1.1"
@@ -40,30 +45,68 @@ TEST_MESSAGES = [
 ]
 
 class DistributedStats:
-    def __init__(self, node_id):
+    def __init__(self, node_id, slo_ttft=SLO_TTFT, slo_tpot=SLO_TPOT, slo_e2e=None):
         self.node_id = node_id
         self.lock = threading.Lock()
         self.sent = 0
         self.completed = 0
         self.failed = 0
+        self.rejected = 0
+        self.aborted = 0
+        self.open_streams = 0
         self.response_times = []
         self.tokens = 0
         self.active = 0
+        self.phase_samples = defaultdict(list)
+        self.connections = 0
+        self.slo = SLOTracker(ttft=slo_ttft, tpot=slo_tpot, e2e=slo_e2e)
     
     def record_sent(self):
         with self.lock:
             self.sent += 1
     
-    def record_completed(self, rt, tok):
+    def record_completed(self, user_id, rt, tok, phases=None, backend=None):
+        self.slo.record(user_id, backend, phases, tok, rt)
         with self.lock:
+            if phases:
+                for name, value in phases.items():
+                    if value is not None:
+                        self.phase_samples[name].append(value)
             self.completed += 1
             self.response_times.append(rt)
             self.tokens += tok
     
-    def record_failed(self):
+    def record_failed(self, user_id, backend=None):
+        self.slo.record(user_id, backend, success=False)
         with self.lock:
             self.failed += 1
     
+    def record_rejected(self, user_id):
+        self.slo.record(user_id, success=False)
+        with self.lock:
+            self.rejected += 1
+    
+    def record_aborted(self):
+        # intentionally abandoned streams are not SLO misses
+        with self.lock:
+            self.aborted += 1
+    
+    def stream_opened(self):
+        with self.lock:
+            self.open_streams += 1
+    
+    def stream_closed(self):
+        with self.lock:
+            self.open_streams -= 1
+    
+    def get_open_streams(self):
+        with self.lock:
+            return self.open_streams
+    
+    def record_connection(self):
+        with self.lock:
+            self.connections += 1
+    
     def inc_active(self):
         with self.lock:
             self.active += 1
@@ -74,6 +117,8 @@ class DistributedStats:
     
     def summary(self):
         with self.lock:
+            # intentionally abandoned streams are neither successes nor failures
+            attempted = self.sent - self.aborted
             avg_rt = sum(self.response_times) / len(self.response_times) if self.response_times else 0
             return {
                 'node': self.node_id,
@@ -81,11 +126,16 @@ class DistributedStats:
                 'sent': self.sent,
                 'completed': self.completed,
                 'failed': self.failed,
+                'rejected': self.rejected,
+                'aborted': self.aborted,
+                'success_rate': self.completed / attempted * 100 if attempted > 0 else 0,
                 'avg_response': avg_rt,
-                'total_tokens': self.tokens
+                'total_tokens': self.tokens,
+                'connections': self.connections,
+                'phases': summarize_phases(self.phase_samples)
             }
 
-def write_user_log(log_dir, node_id, user_id, msg_num, query, response, response_time, token_count, tokens_per_sec, status):
+def write_user_log(log_dir, node_id, user_id, msg_num, query, response, response_time, token_count, tokens_per_sec, status, phases=None):
     """Write detailed log for each user message"""
     log_file = os.path.join(log_dir, f"node{node_id}_user{user_id}.txt")
     
@@ -99,6 +149,8 @@ def write_user_log(log_dir, node_id, user_id, msg_num, query, response, response
         f.write(f"Response Time:    {response_time:.3f}s\n")
         f.write(f"Tokens Generated: {token_count}\n")
         f.write(f"Tokens/Second:    {tokens_per_sec:.2f}\n")
+        if phases:
+            f.write(f"Phases:           {format_phases(phases)}\n")
         f.write("-" * 80 + "\n")
         f.write(f"QUERY:\n{query}\n")
         f.write("-" * 80 + "\n")
@@ -121,6 +173,29 @@ def write_user_summary(log_dir, node_id, user_id, total_messages, total_time, av
         f.write("=" * 80 + "\n")
 
 ENDPOINT_TYPE = None  # will be set to 'chat' or 'completions'
+SHARED_PROMPT = None  # when set, every user sends this exact deterministic prompt
+THINK_TIME = (3, 8)  # random seconds between a user's messages
+KEEPALIVE = True  # reuse one pooled connection per user; False opens a new one per message
+ABORT_FRACTION = 0.0  # fraction of streams the user abandons mid-generation (closed tab / stop button)
+ABORT_AFTER_TOKENS = 20  # abandon after this many tokens (0 = no token limit)
+ABORT_AFTER_SECONDS = 0  # abandon after this many seconds (0 = no time limit)
+
+def should_abort(tok_count, elapsed):
+    """True once an abandoned stream has reached its token or time limit"""
+    if not ABORT_AFTER_TOKENS and not ABORT_AFTER_SECONDS:
+        return True
+    return bool((ABORT_AFTER_TOKENS and tok_count >= ABORT_AFTER_TOKENS) or
+                (ABORT_AFTER_SECONDS and elapsed >= ABORT_AFTER_SECONDS))
+
+def get_gateway_stats(base_url):
+    """Fetch coalescing counters from vllm_gateway.py, if it is in the path"""
+    try:
+        r = requests.get(f"{base_url}/gateway/stats", timeout=5)
+        if r.status_code == 200:
+            return r.json()
+    except Exception:
+        pass
+    return None
 
 def detect_endpoint(base_url, model_id):
     """Try chat and completions endpoints to set ENDPOINT_TYPE with verbose debugging."""
@@ -207,15 +282,31 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
     
     print(f"[Node {node_id}][User {user_id}] Started")
     
+    # one pooled keep-alive session per user
+    session = create_session(keepalive=KEEPALIVE)
+    
     while time.time() - start < duration:
+        stream_open = False
+        response = None
+        abort_timer = None
+        full_resp = ""
+        tok_count = 0
         try:
-            message = random.choice(TEST_MESSAGES)
+            if SHARED_PROMPT:
+                # identical deterministic requests, eligible for gateway coalescing
+                message = SHARED_PROMPT
+                content = message
+                temperature = 0
+            else:
+                message = random.choice(TEST_MESSAGES)
+                content = f"[Node{node_id}User{user_id}] {message}"
+                temperature = 0.7
             # build payload depending on detected endpoint
             if ENDPOINT_TYPE == 'chat':
                 payload = {
                     "model": MODEL_ID,
-                    "messages": [{"role": "user", "content": f"[Node{node_id}User{user_id}] {message}"}],
-                    "temperature": 0.7,
+                    "messages": [{"role": "user", "content": content}],
+                    "temperature": temperature,
                     "max_tokens": 512,
                     "stream": True
                 }
@@ -224,8 +315,8 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
                 # completions-style (prompt)
                 payload = {
                     "model": MODEL_ID,
-                    "prompt": f"[Node{node_id}User{user_id}] {message}",
-                    "temperature": 0.7,
+                    "prompt": content,
+                    "temperature": temperature,
                     "max_tokens": 512,
                     "stream": True
                 }
@@ -233,27 +324,56 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
             
             stats.record_sent()
             req_start = time.time()
+            timer = PhaseTimer()
+            # decide up front whether this user will abandon the stream
+            abort_stream = ABORT_FRACTION > 0 and random.random() < ABORT_FRACTION
+            if abort_stream and ABORT_AFTER_SECONDS:
+                # the user gives up at T whether or not any token has arrived yet
+                abort_timer = threading.Timer(ABORT_AFTER_SECONDS, timer.abort)
+                abort_timer.daemon = True
+                abort_timer.start()
             
-            response = requests.post(
+            response = session.post(
                 url,
                 headers={"Content-Type": "application/json"},
                 json=payload,
                 stream=True,
                 timeout=60
             )
+            timer.headers_received()
+            if timer.new_connection():
+                stats.record_connection()
+            
+            if response.status_code != 200 and abort_timer:
+                abort_timer.cancel()
+            
+            if response.status_code == 429:
+                # shed by gateway admission control; back off as instructed
+                stats.record_rejected(user_id)
+                rt = time.time() - req_start
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                write_user_log(log_dir, node_id, user_id, msg_count + 1, message, 
+                              f"REJECTED: HTTP 429 (Retry-After {retry_after:g}s)", rt, 0, 0, "REJECTED")
+                print(f"[Node {node_id}][User {user_id}] Rejected (429), retry after {retry_after:g}s")
+                response.content  # drain the short error body so the connection is reused
+                time.sleep(retry_after)
+                continue
             
             if response.status_code != 200:
-                stats.record_failed()
+                stats.record_failed(user_id, response.headers.get('X-Upstream-Addr'))
                 rt = time.time() - req_start
                 write_user_log(log_dir, node_id, user_id, msg_count + 1, message, 
                               f"ERROR: HTTP {response.status_code}", rt, 0, 0, "FAILED")
                 print(f"[Node {node_id}][User {user_id}] HTTP Error {response.status_code}")
-                time.sleep(random.uniform(3, 8))
+                response.content  # drain the short error body so the connection is reused
+                time.sleep(random.uniform(*THINK_TIME))
                 continue
             
             full_resp = ""
             tok_count = 0
-            first_token_time = None
+            aborted = False
+            stats.stream_opened()
+            stream_open = True
             
             for line in response.iter_lines():
                 if line:
@@ -261,7 +381,8 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
                     if line.startswith("data: "):
                         data = line[6:]
                         if data == "[DONE]":
-                            break
+                            # read to the end of the body so the connection goes back to the pool
+                            continue
                         try:
                             parsed = json.loads(data)
                         except Exception:
@@ -285,34 +406,70 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
                             if isinstance(msg, dict):
                                 content = msg.get('content', '') or content
                         if content:
-                            if first_token_time is None:
-                                first_token_time = time.time()
+                            timer.token()
                             full_resp += content
                             tok_count += 1
+                            if abort_stream and should_abort(tok_count, time.time() - req_start):
+                                aborted = True
+                                break
+            
+            if abort_timer:
+                abort_timer.cancel()
+            aborted = aborted or timer.aborted
+            if aborted:
+                # drop the TCP connection the way a closed browser tab does
+                response.close()
+            stats.stream_closed()
+            stream_open = False
+            
+            if aborted:
+                rt = time.time() - req_start
+                stats.record_aborted()
+                write_user_log(log_dir, node_id, user_id, msg_count + 1, message, 
+                              full_resp, rt, tok_count, tok_count / rt if rt > 0 else 0, "ABORTED", timer.phases())
+                print(f"[Node {node_id}][User {user_id}] Aborted stream after {tok_count} tokens - {rt:.2f}s")
+                time.sleep(random.uniform(*THINK_TIME))
+                continue
             
             rt = time.time() - req_start
             tokens_per_sec = tok_count / rt if rt > 0 else 0
             
             if full_resp:
-                stats.record_completed(rt, tok_count)
+                phases = timer.phases()
+                stats.record_completed(user_id, rt, tok_count, phases, response.headers.get('X-Upstream-Addr'))
                 msg_count += 1
                 user_response_times.append(rt)
                 user_total_tokens += tok_count
                 
                 write_user_log(log_dir, node_id, user_id, msg_count, message, 
-                              full_resp, rt, tok_count, tokens_per_sec, "SUCCESS")
+                              full_resp, rt, tok_count, tokens_per_sec, "SUCCESS", phases)
                 
-                print(f"[Node {node_id}][User {user_id}] Msg {msg_count} - {rt:.2f}s - {tok_count} tokens - {tokens_per_sec:.2f} tok/s")
+                print(f"[Node {node_id}][User {user_id}] Msg {msg_count} - {rt:.2f}s - {tok_count} tokens - {tokens_per_sec:.2f} tok/s - {format_phases(phases)}")
             else:
-                stats.record_failed()
+                stats.record_failed(user_id, response.headers.get('X-Upstream-Addr'))
                 write_user_log(log_dir, node_id, user_id, msg_count + 1, message, 
                               "No response received", rt, 0, 0, "FAILED")
                 print(f"[Node {node_id}][User {user_id}] Empty response")
             
-            time.sleep(random.uniform(3, 8))
+            time.sleep(random.uniform(*THINK_TIME))
             
         except Exception as e:
-            stats.record_failed()
+            if abort_timer:
+                abort_timer.cancel()
+            if stream_open:
+                stats.stream_closed()
+            if abort_timer and timer.aborted:
+                # the abort timer dropped the connection mid-read
+                if response is not None:
+                    response.close()
+                rt = time.time() - req_start
+                stats.record_aborted()
+                write_user_log(log_dir, node_id, user_id, msg_count + 1, message,
+                              full_resp, rt, tok_count, tok_count / rt if rt > 0 else 0, "ABORTED", timer.phases())
+                print(f"[Node {node_id}][User {user_id}] Aborted stream after {tok_count} tokens - {rt:.2f}s")
+                time.sleep(random.uniform(*THINK_TIME))
+                continue
+            stats.record_failed(user_id)
             rt = time.time() - req_start if 'req_start' in locals() else 0
             error_msg = f"Exception: {str(e)}"
             write_user_log(log_dir, node_id, user_id, msg_count + 1, 
@@ -321,6 +478,8 @@ def simulate_user(user_id, node_id, duration, stats, log_dir):
             print(f"[Node {node_id}][User {user_id}] Error: {e}")
             time.sleep(5)
     
+    session.close()
+    
     # Write user summary
     session_time = time.time() - start
     avg_rt = sum(user_response_times) / len(user_response_times) if user_response_times else 0
@@ -341,9 +500,15 @@ def print_stats_periodic(stats):
         print(f"Sent:          {s['sent']}")
         print(f"Completed:     {s['completed']}")
         print(f"Failed:        {s['failed']}")
-        print(f"Success Rate:  {(s['completed']/s['sent']*100 if s['sent']>0 else 0):.1f}%")
+        print(f"Rejected(429): {s['rejected']}")
+        print(f"Aborted:       {s['aborted']}")
+        print(f"Success Rate:  {s['success_rate']:.1f}% (excl. aborted)")
         print(f"Avg Response:  {s['avg_response']:.2f}s")
         print(f"Total Tokens:  {s['total_tokens']}")
+        o = stats.slo.report()['overall']
+        print(f"SLO Attained:  {o['attainment']:.1f}% ({o['met']}/{o['sent']})")
+        print(f"Goodput:       {o['goodput_rps']:.2f} req/s, {o['goodput_tps']:.0f} tok/s")
+        print_phase_breakdown(s['phases'], s['connections'], s['sent'])
         print(f"{'='*60}\n")
 
 def main():
@@ -355,12 +520,40 @@ def main():
     parser.add_argument('--port', type=str, default='80', help='Server port')
     parser.add_argument('--log-dir', type=str, default='load_test_logs', help='Directory for log files')
     parser.add_argument('--model', type=str, default=None, help='Model ID (overrides default)')
+    parser.add_argument('--think-time', type=float, nargs=2, default=[3, 8], metavar=('MIN', 'MAX'),
+                        help='Random seconds between messages (use 0 0 to overload)')
+    parser.add_argument('--goodput-deadline', type=float, default=60,
+                        help='End-to-end SLO: seconds within which a completion counts towards goodput')
+    parser.add_argument('--slo-ttft', type=float, default=SLO_TTFT, help='Time-to-first-token SLO in seconds')
+    parser.add_argument('--slo-tpot', type=float, default=SLO_TPOT, help='Time-per-output-token SLO in seconds')
+    parser.add_argument('--no-keepalive', action='store_true',
+                        help='Open a new connection for every message instead of reusing one per user')
+    parser.add_argument('--abort-fraction', type=float, default=0.0,
+                        help='Fraction of streams abandoned mid-generation (0-1)')
+    parser.add_argument('--abort-after-tokens', type=int, default=20,
+                        help='Abandon a stream after this many tokens (0 = no token limit)')
+    parser.add_argument('--abort-after-seconds', type=float, default=0,
+                        help='Abandon a stream after this many seconds (0 = no time limit)')
+    parser.add_argument('--metrics-url', action='append', default=[],
+                        help='vLLM /metrics URL to sample, e.g. http://192.168.1.1:8000/metrics (repeatable)')
+    parser.add_argument('--metrics-interval', type=float, default=1.0, help='Seconds between /metrics samples')
+    parser.add_argument('--drain-timeout', type=float, default=15,
+                        help='Seconds to wait after the load stops for backends to report no running requests')
+    parser.add_argument('--shared-prompt', type=str, default=None,
+                        help='Send this exact prompt from every user at temperature 0 (coalescing scenario)')
     
     args = parser.parse_args()
     
-    global SERVER_HOST, SERVER_PORT, BASE_URL, MODEL_ID
+    global SERVER_HOST, SERVER_PORT, BASE_URL, MODEL_ID, SHARED_PROMPT, THINK_TIME, KEEPALIVE
+    global ABORT_FRACTION, ABORT_AFTER_TOKENS, ABORT_AFTER_SECONDS
     SERVER_HOST = args.server
     SERVER_PORT = args.port
+    SHARED_PROMPT = args.shared_prompt
+    THINK_TIME = tuple(args.think_time)
+    KEEPALIVE = not args.no_keepalive
+    ABORT_FRACTION = args.abort_fraction
+    ABORT_AFTER_TOKENS = args.abort_after_tokens
+    ABORT_AFTER_SECONDS = args.abort_after_seconds
     
     if SERVER_PORT and SERVER_PORT != "80":
         BASE_URL = f"http://{SERVER_HOST}:{SERVER_PORT}"
@@ -385,6 +578,17 @@ def main():
     print(f"Users:         {args.users}")
     print(f"Duration:      {args.duration}s")
     print(f"Log Directory: {os.path.abspath(log_dir)}")
+    print(f"Keep-Alive:    {'on' if KEEPALIVE else 'off'}")
+    if ABORT_FRACTION > 0:
+        limits = []
+        if ABORT_AFTER_TOKENS:
+            limits.append(f"{ABORT_AFTER_TOKENS} tokens")
+        if ABORT_AFTER_SECONDS:
+            limits.append(f"{ABORT_AFTER_SECONDS:g}s")
+        print(f"Abort Streams: {ABORT_FRACTION * 100:.0f}% after {' or '.join(limits) or 'first token'}")
+    print(f"SLOs:          TTFT <= {args.slo_ttft * 1000:.0f}ms, TPOT <= {args.slo_tpot * 1000:.0f}ms, E2E <= {args.goodput_deadline:g}s")
+    if SHARED_PROMPT:
+        print(f"Scenario:      shared prompt (coalescing)")
     print(f"{'='*60}\n")
     
     # Test connection
@@ -432,12 +636,20 @@ def main():
     print(f"✓ Detected endpoint: {ENDPOINT_TYPE}")
     print(f"✓ Using model: {MODEL_ID}\n")
     
-    stats = DistributedStats(args.node_id)
+    stats = DistributedStats(args.node_id, args.slo_ttft, args.slo_tpot, args.goodput_deadline)
+    gateway_before = get_gateway_stats(BASE_URL)
     
     # Start stats thread
     stats_thread = threading.Thread(target=print_stats_periodic, args=(stats,), daemon=True)
     stats_thread.start()
     
+    # Sample backend /metrics so generations still running after their
+    # client disconnected ("zombies") can be detected
+    sampler = None
+    if args.metrics_url:
+        sampler = ServerMetricsSampler(args.metrics_url, args.metrics_interval, stats.get_open_streams)
+        sampler.start()
+    
     # Start user threads
     threads = []
     for i in range(args.users):
@@ -451,6 +663,14 @@ def main():
     for thread in threads:
         thread.join()
     
+    # Taken before the drain check so goodput is not divided by the drain wait
+    slo_report = stats.slo.report()
+    
+    drain_time = still_running = None
+    if sampler:
+        sampler.stop()
+        drain_time, still_running = sampler.wait_for_drain(args.drain_timeout)
+    
     # Final results
     s = stats.summary()
     print(f"\n{'='*60}")
@@ -460,9 +680,51 @@ def main():
     print(f"Sent:          {s['sent']}")
     print(f"Completed:     {s['completed']}")
     print(f"Failed:        {s['failed']}")
-    print(f"Success Rate:  {(s['completed']/s['sent']*100 if s['sent']>0 else 0):.1f}%")
+    print(f"Rejected(429): {s['rejected']}")
+    print(f"Aborted:       {s['aborted']}")
+    print(f"Success Rate:  {s['success_rate']:.1f}% (excl. aborted)")
     print(f"Avg Response:  {s['avg_response']:.2f}s")
     print(f"Total Tokens:  {s['total_tokens']}")
+    print_phase_breakdown(s['phases'], s['connections'], s['sent'])
+    
+    print_slo_report(slo_report)
+    slo_csv = os.path.join(log_dir, f"node{args.node_id}_slo_timeseries.csv")
+    write_slo_timeseries(slo_csv, slo_report)
+    print(f"\nSLO time series: {os.path.abspath(slo_csv)}")
+    
+    if sampler:
+        excess = sampler.excess_report()
+        print(f"\nServer Metrics ({len(args.metrics_url)} endpoint(s), {len(sampler.samples)} samples):")
+        if sampler.samples:
+            print(f"  Max Running:       {max(p['running'] for p in sampler.samples):.0f}")
+            print(f"  Max Waiting:       {max(p['waiting'] for p in sampler.samples):.0f}")
+        if excess:
+            # only meaningful when this node is the only client of these backends
+            print(f"  Running - Open Streams: max {excess['max_excess']:.0f}, avg {excess['avg_excess']:.2f}, "
+                  f"{excess['excess_seconds']:.0f} slot-seconds")
+        if still_running is None:
+            print(f"  Drain Check:       no /metrics endpoint answered")
+        elif still_running == 0:
+            print(f"  Drain Check:       idle {drain_time:.1f}s after the load stopped")
+        else:
+            print(f"  ⚠️  Zombie generations: {still_running:.0f} request(s) still running "
+                  f"{drain_time:.0f}s after every client disconnected")
+    
+    gateway_after = get_gateway_stats(BASE_URL)
+    if gateway_before and gateway_after:
+        client_reqs = gateway_after['client_requests'] - gateway_before['client_requests']
+        upstream_reqs = gateway_after['upstream_requests'] - gateway_before['upstream_requests']
+        coalesced_reqs = gateway_after['coalesced_requests'] - gateway_before['coalesced_requests']
+        reduction = coalesced_reqs / client_reqs * 100 if client_reqs > 0 else 0
+        print(f"\nGateway Client Requests:   {client_reqs}")
+        print(f"Gateway Upstream Requests: {upstream_reqs}")
+        print(f"Backend Load Reduction:    {reduction:.1f}%")
+        if 'upstream_cancelled' in gateway_after:
+            print(f"Gateway Cancelled:         {gateway_after['upstream_cancelled'] - gateway_before['upstream_cancelled']}")
+        if 'over_budget' in gateway_after:
+            print(f"Gateway Rate Limited:      {gateway_after['rate_limited'] - gateway_before['rate_limited']}")
+            print(f"Gateway Over Budget:       {gateway_after['over_budget'] - gateway_before['over_budget']}")
+    
     print(f"{'='*60}")
     print(f"\nLogs saved to: {os.path.abspath(log_dir)}")
     print(f"View user logs: ls {log_dir}/node{args.node_id}_user*.txt")
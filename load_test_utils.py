@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP helpers for the vLLM load test scripts
+Pooled keep-alive sessions and per-phase request timing
+"""
+import socket
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Phases are reported as seconds since the request started
+PHASES = ('connect', 'sent', 'headers', 'first_token', 'last_token')
+PHASE_LABELS = {
+    'connect': 'Connect (DNS+TCP)',
+    'sent': 'Request Sent',
+    'headers': 'Response Headers',
+    'first_token': 'First Token',
+    'last_token': 'Last Token'
+}
+
+# Each load-test worker is a thread with its own session, so connection
+# events can be handed to the PhaseTimer through thread-local storage.
+_phase = threading.local()
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.time()
+        super().connect()
+        _phase.connect = time.time() - start
+
+    def request(self, *args, **kwargs):
+        timer = getattr(_phase, 'timer', None)
+        if timer is not None:
+            timer.attach(self)
+        result = super().request(*args, **kwargs)
+        _phase.sent = time.time()
+        return result
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report connect and send times"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+
+def create_session(pool_size=1, keepalive=True):
+    """Create a pooled session for one worker; keepalive=False forces a new TCP connection per request"""
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keepalive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date)"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class PhaseTimer:
+    """Timestamps for one request made from the current thread"""
+
+    def __init__(self):
+        _phase.connect = None
+        _phase.sent = None
+        _phase.timer = self
+        self.start = time.time()
+        self.headers_at = None
+        self.first_token_at = None
+        self.last_token_at = None
+        self.lock = threading.Lock()
+        self.connection = None
+        self.aborted = False
+
+    def attach(self, connection):
+        with self.lock:
+            self.connection = connection
+            aborted = self.aborted
+        if aborted:
+            self._shutdown()
+
+    def abort(self):
+        """Drop the request's connection from another thread, e.g. a threading.Timer.
+        Unblocks a read still waiting for headers or tokens; the reading thread sees
+        an exception or the end of the stream and should check .aborted."""
+        with self.lock:
+            self.aborted = True
+        self._shutdown()
+
+    def _shutdown(self):
+        sock = getattr(self.connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def headers_received(self):
+        self.headers_at = time.time()
+
+    def token(self):
+        now = time.time()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+
+    def new_connection(self):
+        """True if this request had to open a new TCP connection"""
+        return getattr(_phase, 'connect', None) is not None
+
+    def phases(self):
+        """Seconds since request start for each phase (connect is 0 on a reused connection)"""
+        def since_start(t):
+            return t - self.start if t is not None else None
+
+        connect = getattr(_phase, 'connect', None)
+        return {
+            'connect': connect if connect is not None else 0.0,
+            'sent': since_start(getattr(_phase, 'sent', None)),
+            'headers': since_start(self.headers_at),
+            'first_token': since_start(self.first_token_at),
+            'last_token': since_start(self.last_token_at)
+        }
+
+
+def format_phases(phases):
+    """One-line phase breakdown in milliseconds for logs"""
+    parts = []
+    for name in PHASES:
+        value = phases.get(name)
+        parts.append(f"{name}={value * 1000:.0f}ms" if value is not None else f"{name}=-")
+    return " ".join(parts)
+
+
+def summarize_phases(samples):
+    """Average, p50 and p95 per phase from a {phase: [seconds, ...]} dict"""
+    summary = {}
+    for name in PHASES:
+        values = sorted(samples.get(name, []))
+        if not values:
+            continue
+        summary[name] = {
+            'avg': sum(values) / len(values),
+            'p50': values[len(values) // 2],
+            'p95': values[int(len(values) * 0.95)]
+        }
+    return summary
+
+
+def print_phase_breakdown(phase_summary, connections_opened=None, requests_made=None):
+    """Print a phase summary table (milliseconds since request start)"""
+    if not phase_summary:
+        return
+    print(f"\nPhase Breakdown (ms since request start):")
+    print(f"  {'Phase':<20}{'Avg':>10}{'P50':>10}{'P95':>10}")
+    for name in PHASES:
+        if name in phase_summary:
+            p = phase_summary[name]
+            print(f"  {PHASE_LABELS[name]:<20}{p['avg'] * 1000:>10.1f}{p['p50'] * 1000:>10.1f}{p['p95'] * 1000:>10.1f}")
+    if connections_opened is not None and requests_made:
+        print(f"  New connections: {connections_opened} for {requests_made} requests "
+              f"({connections_opened / requests_made * 100:.0f}%)")
+
+
+# Service-level objectives: a request counts towards goodput only if it meets all of them
+SLO_TTFT = 1.0      # seconds from request start to first content token
+SLO_TPOT = 0.050    # seconds per output token after the first
+SLO_WINDOW = 10     # seconds per bucket in the SLO-attainment time series
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list, matching the load tests' own percentiles"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+def jains_index(values):
+    """Jain's fairness index: 1.0 when all values are equal, 1/n when one takes everything"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    if squares == 0:
+        return 1.0
+    return total * total / (len(values) * squares)
+
+
+class SLOTracker:
+    """Thread-safe per-request SLO outcomes for goodput and fairness reports"""
+
+    def __init__(self, ttft=SLO_TTFT, tpot=SLO_TPOT, e2e=None, window=SLO_WINDOW):
+        self.ttft = ttft
+        self.tpot = tpot
+        self.e2e = e2e
+        self.window = window
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.records = []
+
+    def record(self, user, backend=None, phases=None, tokens=0, response_time=None, success=True):
+        """Record one request attempt; failed or rejected attempts count as SLO misses"""
+        if backend:
+            # Nginx lists every backend it tried ("a, b", or "a : b" after an
+            # internal redirect); the last one served the response
+            backend = backend.replace(' : ', ',').split(',')[-1].strip() or None
+        ttft = phases.get('first_token') if phases else None
+        tpot = None
+        if ttft is not None and tokens > 1 and phases.get('last_token') is not None:
+            tpot = (phases['last_token'] - ttft) / (tokens - 1)
+        ttft_ok = success and ttft is not None and ttft <= self.ttft
+        tpot_ok = success and (tpot is None or tpot <= self.tpot)
+        e2e_ok = success and (self.e2e is None or (response_time is not None and response_time <= self.e2e))
+        met = ttft_ok and tpot_ok and e2e_ok
+        with self.lock:
+            self.records.append({
+                'user': user,
+                'backend': backend,
+                'finished': time.time() - self.start_time,
+                'success': success,
+                'ttft': ttft,
+                'tpot': tpot,
+                'response_time': response_time if success else None,
+                'tokens': tokens if success else 0,
+                'ttft_ok': ttft_ok,
+                'tpot_ok': tpot_ok,
+                'met': met
+            })
+        return met
+
+    @staticmethod
+    def _group(records):
+        total = len(records)
+        met = [r for r in records if r['met']]
+        ttfts = [r['ttft'] for r in records if r['success'] and r['ttft'] is not None]
+        rts = [r['response_time'] for r in records if r['success']]
+        return {
+            'sent': total,
+            'completed': sum(1 for r in records if r['success']),
+            'met': len(met),
+            'attainment': len(met) / total * 100 if total > 0 else 0,
+            'good_tokens': sum(r['tokens'] for r in met),
+            'p95_ttft': percentile(ttfts, 0.95),
+            'p95_response': percentile(rts, 0.95)
+        }
+
+    def report(self):
+        with self.lock:
+            records = list(self.records)
+        elapsed = time.time() - self.start_time
+
+        overall = self._group(records)
+        total = overall['sent']
+        overall['ttft_attainment'] = sum(1 for r in records if r['ttft_ok']) / total * 100 if total > 0 else 0
+        overall['tpot_attainment'] = sum(1 for r in records if r['tpot_ok']) / total * 100 if total > 0 else 0
+        overall['goodput_rps'] = overall['met'] / elapsed if elapsed > 0 else 0
+        overall['goodput_tps'] = overall['good_tokens'] / elapsed if elapsed > 0 else 0
+
+        by_user = {}
+        by_backend = {}
+        by_window = {}
+        unattributed = []  # failed/rejected before any backend answered
+        for r in records:
+            by_user.setdefault(r['user'], []).append(r)
+            if r['backend']:
+                by_backend.setdefault(r['backend'], []).append(r)
+            else:
+                unattributed.append(r)
+            by_window.setdefault(int(r['finished'] // self.window), []).append(r)
+        users = {u: self._group(rs) for u, rs in by_user.items()}
+        backends = {b: self._group(rs) for b, rs in by_backend.items()}
+
+        def worst(groups, field):
+            values = [g[field] for g in groups.values() if g[field] is not None]
+            return max(values) if values else None
+
+        # Every window is emitted, so a stall with no finished requests shows as zeros
+        timeseries = []
+        last_index = max([int(elapsed // self.window)] + list(by_window))
+        for index in range(last_index + 1):
+            window = by_window.get(index, [])
+            met = sum(1 for r in window if r['met'])
+            timeseries.append({
+                'start': index * self.window,
+                'end': (index + 1) * self.window,
+                'requests': len(window),
+                'met': met,
+                'attainment': met / len(window) * 100 if window else 0,
+                'tokens_per_sec': sum(r['tokens'] for r in window) / self.window,
+                'p50_tpot': percentile([r['tpot'] for r in window if r['tpot'] is not None], 0.5)
+            })
+
+        return {
+            'slo': {'ttft': self.ttft, 'tpot': self.tpot, 'e2e': self.e2e},
+            'elapsed': elapsed,
+            'overall': overall,
+            'users': users,
+            'backends': backends,
+            'unattributed': self._group(unattributed),
+            'user_fairness': {
+                'jain_attainment': jains_index([g['attainment'] for g in users.values()]),
+                'jain_goodput': jains_index([g['good_tokens'] for g in users.values()]),
+                'worst_p95_ttft': worst(users, 'p95_ttft'),
+                'worst_p95_response': worst(users, 'p95_response')
+            },
+            'backend_fairness': {
+                'jain_requests': jains_index([g['sent'] for g in backends.values()]),
+                'jain_attainment': jains_index([g['attainment'] for g in backends.values()]),
+                'worst_p95_ttft': worst(backends, 'p95_ttft')
+            },
+            'timeseries': timeseries
+        }
+
+
+def _fmt_seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def _fmt_index(value):
+    return f"{value:.3f}" if value is not None else "-"
+
+
+def print_goodput_line(report):
+    """One-line goodput summary for periodic stats"""
+    o = report['overall']
+    print(f"SLO Attainment:     {o['attainment']:.1f}% ({o['met']}/{o['sent']})")
+    print(f"Goodput:            {o['goodput_rps']:.2f} req/s, {o['goodput_tps']:.0f} tok/s")
+
+
+def print_slo_report(report, show_users=True):
+    """Print goodput, SLO attainment, fairness and the attainment time series"""
+    slo = report['slo']
+    o = report['overall']
+    e2e = f", E2E <= {slo['e2e']:g}s" if slo['e2e'] is not None else ""
+    print(f"\nSLOs: TTFT <= {slo['ttft'] * 1000:.0f}ms, TPOT <= {slo['tpot'] * 1000:.0f}ms{e2e}")
+    print(f"  SLO Attainment:   {o['attainment']:.1f}% ({o['met']}/{o['sent']} requests)")
+    print(f"  TTFT Attainment:  {o['ttft_attainment']:.1f}%")
+    print(f"  TPOT Attainment:  {o['tpot_attainment']:.1f}%")
+    print(f"  Goodput:          {o['goodput_rps']:.2f} req/s, {o['goodput_tps']:.0f} tok/s")
+
+    uf = report['user_fairness']
+    print(f"\nPer-User Fairness ({len(report['users'])} users):")
+    print(f"  Jain's Index (attainment): {_fmt_index(uf['jain_attainment'])}")
+    print(f"  Jain's Index (goodput):    {_fmt_index(uf['jain_goodput'])}")
+    print(f"  Worst-User P95 TTFT:       {_fmt_seconds(uf['worst_p95_ttft'])}")
+    print(f"  Worst-User P95 Response:   {_fmt_seconds(uf['worst_p95_response'])}")
+    if show_users and report['users']:
+        print(f"  {'User':<12}{'Sent':>6}{'Done':>6}{'Fail':>6}{'SLO%':>8}{'P95 TTFT':>10}{'P95 Resp':>10}")
+        for user in sorted(report['users'], key=str):
+            g = report['users'][user]
+            print(f"  {str(user):<12}{g['sent']:>6}{g['completed']:>6}{g['sent'] - g['completed']:>6}"
+                  f"{g['attainment']:>7.1f}%{_fmt_seconds(g['p95_ttft']):>10}{_fmt_seconds(g['p95_response']):>10}")
+
+    bf = report['backend_fairness']
+    print(f"\nPer-Node Fairness ({len(report['backends'])} backends, from X-Upstream-Addr):")
+    print(f"  Jain's Index (requests):   {_fmt_index(bf['jain_requests'])}")
+    print(f"  Jain's Index (attainment): {_fmt_index(bf['jain_attainment'])}")
+    print(f"  Worst-Node P95 TTFT:       {_fmt_seconds(bf['worst_p95_ttft'])}")
+    print(f"  {'Backend':<24}{'Sent':>6}{'SLO%':>8}{'P95 TTFT':>10}")
+    for backend in sorted(report['backends']):
+        g = report['backends'][backend]
+        print(f"  {backend:<24}{g['sent']:>6}{g['attainment']:>7.1f}%{_fmt_seconds(g['p95_ttft']):>10}")
+    u = report['unattributed']
+    if u['sent']:
+        # Not part of the indices above: these never reached a backend
+        print(f"  {'(no backend)':<24}{u['sent']:>6}{u['attainment']:>7.1f}%{'-':>10}")
+
+    if report['timeseries']:
+        print(f"\nSLO Attainment Over Time:")
+        print(f"  {'Window':<14}{'Requests':>10}{'Met':>6}{'SLO%':>8}{'Tok/s':>9}{'P50 TPOT':>10}")
+        for w in report['timeseries']:
+            label = f"{w['start']:g}-{w['end']:g}s"
+            tpot = f"{w['p50_tpot'] * 1000:.0f}ms" if w['p50_tpot'] is not None else "-"
+            print(f"  {label:<14}{w['requests']:>10}{w['met']:>6}{w['attainment']:>7.1f}%{w['tokens_per_sec']:>9.0f}{tpot:>10}")
+
+
+def write_slo_timeseries(path, report):
+    """Write the SLO-attainment time series as CSV"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("window_start_s,window_end_s,requests,met,attainment_pct,tokens_per_s,p50_tpot_ms\n")
+        for w in report['timeseries']:
+            tpot = f"{w['p50_tpot'] * 1000:.1f}" if w['p50_tpot'] is not None else ""
+            f.write(f"{w['start']},{w['end']},{w['requests']},{w['met']},{w['attainment']:.1f},"
+                    f"{w['tokens_per_sec']:.1f},{tpot}\n")
+
+
+class ServerMetricsSampler:
+    """Polls vLLM /metrics endpoints in the background and sums the request gauges"""
+
+    GAUGES = ('vllm:num_requests_running', 'vllm:num_requests_waiting')
+
+    def __init__(self, urls, interval=1.0, client_streams=None):
+        self.urls = urls
+        self.interval = interval
+        # Optional callable returning how many streams the load test has open right now
+        self.client_streams = client_streams
+        self.lock = threading.Lock()
+        self.samples = []
+        self.start_time = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def parse(text, names):
+        """Sum Prometheus samples for the given metric names across all label sets"""
+        totals = {name: 0.0 for name in names}
+        for line in text.splitlines():
+            if not line or line.startswith('#'):
+                continue
+            name = line.split('{', 1)[0].split(' ', 1)[0]
+            if name in totals:
+                try:
+                    totals[name] += float(line.rsplit(' ', 1)[-1])
+                except ValueError:
+                    continue
+        return totals
+
+    def sample(self):
+        """Take one sample across all endpoints; None if none of them answered"""
+        totals = {name: 0.0 for name in self.GAUGES}
+        answered = 0
+        for url in self.urls:
+            try:
+                r = requests.get(url, timeout=2)
+                if r.status_code != 200:
+                    continue
+                for name, value in self.parse(r.text, self.GAUGES).items():
+                    totals[name] += value
+                answered += 1
+            except Exception:
+                continue
+        if not answered:
+            return None
+        point = {
+            't': time.time() - self.start_time,
+            'running': totals['vllm:num_requests_running'],
+            'waiting': totals['vllm:num_requests_waiting'],
+            'client_streams': self.client_streams() if self.client_streams else None
+        }
+        with self.lock:
+            self.samples.append(point)
+        return point
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def excess_report(self):
+        """Server-side running requests beyond the streams the client still holds open"""
+        with self.lock:
+            points = [p for p in self.samples if p['client_streams'] is not None]
+        if not points:
+            return None
+        excess = [max(0.0, p['running'] - p['client_streams']) for p in points]
+        return {
+            'samples': len(points),
+            'max_excess': max(excess),
+            'avg_excess': sum(excess) / len(excess),
+            'excess_seconds': sum(excess) * self.interval
+        }
+
+    def wait_for_drain(self, timeout):
+        """After the load stops, poll until no request is running; returns (seconds, still_running)"""
+        start = time.time()
+        point = None
+        while time.time() - start < timeout:
+            point = self.sample()
+            if point and point['running'] == 0:
+                return time.time() - start, 0
+            time.sleep(min(self.interval, 0.5))
+        return time.time() - start, point['running'] if point else None
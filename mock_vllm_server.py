@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Mock vLLM OpenAI-Compatible Server
+Simulates prefill/decode timing, a fixed number of batch slots and the
+vLLM Prometheus gauges, so the load tests and benchmarks can be exercised
+without GPUs. --ignore-disconnect reproduces "zombie" generations that
+keep their decode slot after the client has gone away; --startup-delay
+and --warmup-seconds imitate weight loading and post-start warm-up.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuration
+LISTEN_HOST = "0.0.0.0"
+LISTEN_PORT = 8000
+MODEL_ID = "mock-model"
+MAX_NUM_SEQS = 16        # concurrent sequences (batch slots), like vLLM's --max-num-seqs
+TTFT = 0.1               # seconds of prefill before the first token
+TPOT = 0.02              # seconds per output token
+DEFAULT_OUTPUT_TOKENS = 128  # tokens generated before "EOS" unless ignore_eos/min_tokens ask for more
+MAX_MODEL_LEN = 8192     # prompt + max_tokens limit, like vLLM's --max-model-len
+
+
+class MockEngine:
+    def __init__(self, max_num_seqs, ttft, tpot, warmup_seconds=0):
+        self.slots = threading.Semaphore(max_num_seqs)
+        self.lock = threading.Lock()
+        self.ttft = ttft
+        self.tpot = tpot
+        self.warmup_seconds = warmup_seconds
+        self.ready_at = time.time()
+        self.running = 0
+        self.waiting = 0
+        self.zombies = 0
+        self.aborted = 0
+        self.finished = 0
+        self.prompt_tokens = 0
+        self.generation_tokens = 0
+
+    def token_delay(self):
+        # Decode starts 3x slower right after start-up (compilation, cache
+        # warm-up) and settles to TPOT once warmup_seconds have passed
+        since_ready = time.time() - self.ready_at
+        if self.warmup_seconds and since_ready < self.warmup_seconds:
+            return self.tpot * (1 + 2 * (1 - since_ready / self.warmup_seconds))
+        return self.tpot
+
+    def acquire(self):
+        with self.lock:
+            self.waiting += 1
+        self.slots.acquire()
+        with self.lock:
+            self.waiting -= 1
+            self.running += 1
+
+    def release(self, outcome):
+        with self.lock:
+            self.running -= 1
+            if outcome == 'aborted':
+                self.aborted += 1
+            else:
+                self.finished += 1
+        self.slots.release()
+
+    def set_zombie(self, delta):
+        with self.lock:
+            self.zombies += delta
+
+    def add_tokens(self, prompt=0, generated=0):
+        with self.lock:
+            self.prompt_tokens += prompt
+            self.generation_tokens += generated
+
+    def metrics(self, model):
+        with self.lock:
+            label = f'{{model_name="{model}"}}'
+            lines = [
+                "# TYPE vllm:num_requests_running gauge",
+                f"vllm:num_requests_running{label} {self.running}",
+                "# TYPE vllm:num_requests_waiting gauge",
+                f"vllm:num_requests_waiting{label} {self.waiting}",
+                "# TYPE vllm:prompt_tokens_total counter",
+                f"vllm:prompt_tokens_total{label} {self.prompt_tokens}",
+                "# TYPE vllm:generation_tokens_total counter",
+                f"vllm:generation_tokens_total{label} {self.generation_tokens}",
+                "# TYPE mock:zombie_requests gauge",
+                f"mock:zombie_requests{label} {self.zombies}",
+                "# TYPE mock:aborted_requests_total counter",
+                f"mock:aborted_requests_total{label} {self.aborted}",
+                "# TYPE mock:finished_requests_total counter",
+                f"mock:finished_requests_total{label} {self.finished}",
+            ]
+            return "\n".join(lines) + "\n"
+
+
+def count_tokens(text):
+    """Whitespace tokenizer; good enough for a mock"""
+    return len(text.split())
+
+
+def output_length(body):
+    max_tokens = body.get('max_tokens') or DEFAULT_OUTPUT_TOKENS
+    if body.get('ignore_eos'):
+        return max_tokens
+    return max(min(max_tokens, DEFAULT_OUTPUT_TOKENS), min(body.get('min_tokens') or 0, max_tokens))
+
+
+def make_handler(engine, model, ignore_disconnect, max_model_len):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, data, content_type='application/json'):
+            if isinstance(data, (dict, list)):
+                data = json.dumps(data)
+            data = data.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, data):
+            data = data.encode('utf-8')
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, '', 'text/plain')
+            elif self.path == '/v1/models':
+                self._send(200, {'object': 'list', 'data': [{'id': model, 'object': 'model', 'owned_by': 'mock',
+                                                              'max_model_len': max_model_len}]})
+            elif self.path == '/metrics':
+                self._send(200, engine.metrics(model), 'text/plain; version=0.0.4')
+            else:
+                self._send(404, {'error': {'message': f"Not found: {self.path}"}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                self._send(400, {'error': {'message': "Invalid JSON"}})
+                return
+
+            if self.path == '/tokenize':
+                text = body.get('prompt')
+                if text is None:
+                    text = "".join(str(m.get('content', '')) for m in body.get('messages') or [])
+                tokens = [hash(word) % 32000 for word in text.split()]
+                self._send(200, {'tokens': tokens, 'count': len(tokens), 'max_model_len': max_model_len})
+                return
+
+            if self.path not in ('/v1/chat/completions', '/v1/completions'):
+                self._send(404, {'error': {'message': f"Not found: {self.path}"}})
+                return
+
+            chat = self.path == '/v1/chat/completions'
+            if chat:
+                prompts = ["".join(str(m.get('content', '')) for m in body.get('messages') or [])]
+            else:
+                prompt = body.get('prompt', '')
+                prompts = prompt if isinstance(prompt, list) else [prompt]
+            n_out = output_length(body)
+            prompt_tokens = sum(count_tokens(p) for p in prompts)
+            requested = (max(count_tokens(p) for p in prompts) if prompts else 0) + (body.get('max_tokens') or 0)
+            if requested > max_model_len:
+                self._send(400, {'error': {'message': f"This model's maximum context length is {max_model_len} tokens. "
+                                                      f"However, you requested {requested} tokens.",
+                                           'type': 'BadRequestError'}})
+                return
+            engine.add_tokens(prompt=prompt_tokens)
+
+            if body.get('stream'):
+                include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+                self._stream(chat, n_out, prompt_tokens if include_usage else None)
+            else:
+                self._complete(chat, prompts, n_out, prompt_tokens)
+
+        def _complete(self, chat, prompts, n_out, prompt_tokens):
+            engine.acquire()
+            try:
+                time.sleep(engine.ttft)
+                for _ in range(n_out):
+                    time.sleep(engine.token_delay())
+                engine.add_tokens(generated=n_out * len(prompts))
+            finally:
+                engine.release('finished')
+            text = " ".join(f"tok{i}" for i in range(n_out))
+            if chat:
+                choices = [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'length'}]
+            else:
+                choices = [{'index': i, 'text': text, 'finish_reason': 'length'} for i in range(len(prompts))]
+            self._send(200, {
+                'id': f"cmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion' if chat else 'text_completion',
+                'model': model,
+                'choices': choices,
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': n_out * len(prompts),
+                          'total_tokens': prompt_tokens + n_out * len(prompts)}
+            })
+
+        def _stream(self, chat, n_out, usage_prompt_tokens=None):
+            engine.acquire()
+            outcome = 'finished'
+            disconnected = False
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                time.sleep(engine.ttft)
+                for i in range(n_out):
+                    if i > 0:
+                        time.sleep(engine.token_delay())
+                    engine.add_tokens(generated=1)
+                    if disconnected:
+                        continue
+                    if chat:
+                        choice = {'index': 0, 'delta': {'content': f"tok{i} "}, 'finish_reason': None}
+                    else:
+                        choice = {'index': 0, 'text': f"tok{i} ", 'finish_reason': None}
+                    try:
+                        self._write_chunk(f"data: {json.dumps({'choices': [choice]})}\n\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        if not ignore_disconnect:
+                            outcome = 'aborted'
+                            return
+                        # Keep decoding for nobody, like a server that never notices the abort
+                        disconnected = True
+                        engine.set_zombie(1)
+                if disconnected:
+                    engine.set_zombie(-1)
+                    outcome = 'aborted'
+                    return
+                if usage_prompt_tokens is not None:
+                    usage = {'prompt_tokens': usage_prompt_tokens, 'completion_tokens': n_out,
+                             'total_tokens': usage_prompt_tokens + n_out}
+                    self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                outcome = 'aborted'
+            finally:
+                if outcome == 'aborted':
+                    self.close_connection = True
+                engine.release(outcome)
+
+    return MockHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock vLLM OpenAI-compatible server')
+    parser.add_argument('--host', type=str, default=LISTEN_HOST, help='Listen address')
+    parser.add_argument('--port', type=int, default=LISTEN_PORT, help='Listen port')
+    parser.add_argument('--model', type=str, default=MODEL_ID, help='Model ID reported by /v1/models')
+    parser.add_argument('--max-num-seqs', type=int, default=MAX_NUM_SEQS, help='Concurrent sequences (batch slots)')
+    parser.add_argument('--ttft', type=float, default=TTFT, help='Prefill seconds before the first token')
+    parser.add_argument('--tpot', type=float, default=TPOT, help='Seconds per output token')
+    parser.add_argument('--max-model-len', type=int, default=MAX_MODEL_LEN, help='Prompt + max_tokens limit')
+    parser.add_argument('--startup-delay', type=float, default=0, help='Seconds before the port opens (weight loading)')
+    parser.add_argument('--warmup-seconds', type=float, default=0, help='Seconds of slower decode after start-up')
+    parser.add_argument('--ignore-disconnect', action='store_true', help='Keep decoding after the client disconnects (zombie generations)')
+
+    args = parser.parse_args()
+
+    if args.startup_delay > 0:
+        # Like vLLM, the API port only opens once the weights are loaded
+        print(f"Loading mock weights for {args.startup_delay:g}s...")
+        time.sleep(args.startup_delay)
+
+    engine = MockEngine(args.max_num_seqs, args.ttft, args.tpot, args.warmup_seconds)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(engine, args.model, args.ignore_disconnect,
+                                                                       args.max_model_len))
+    server.daemon_threads = True
+
+    print(f"\n{'='*60}")
+    print(f"MOCK vLLM SERVER")
+    print(f"{'='*60}")
+    print(f"Listening:     http://{args.host}:{args.port}")
+    print(f"Model:         {args.model}")
+    print(f"Batch Slots:   {args.max_num_seqs}")
+    print(f"TTFT / TPOT:   {args.ttft * 1000:.0f}ms / {args.tpot * 1000:.0f}ms")
+    print(f"Disconnects:   {'ignored (zombie mode)' if args.ignore_disconnect else 'abort generation'}")
+    print(f"{'='*60}\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\nMock server stopped")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
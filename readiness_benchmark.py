@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Cold-Start and Scale-Out Readiness Benchmark for vLLM
+Polls /health and /v1/models at high frequency from the moment backends
+are launched and records time-to-healthy, time-to-first-token and time
+until the decode rate reaches steady state, for one or several backends
+coming up at once.
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from load_test_utils import create_session
+
+# Configuration
+POLL_INTERVAL = 0.1       # seconds between /health and /v1/models polls
+READY_TIMEOUT = 1800      # give up on a backend after 30 minutes
+PROBE_PROMPT = "Write a short paragraph about distributed systems."
+PROBE_MAX_TOKENS = 128    # decode length of each steady-state probe
+STEADY_WINDOW = 3         # consecutive probes that must agree
+STEADY_TOLERANCE = 0.10   # max relative spread of decode rate within the window
+
+
+def exited(process):
+    """True if a --launch process has already exited"""
+    return process is not None and process.poll() is not None
+
+
+def poll_until(session, url, deadline, interval, accept, process=None):
+    """Poll url until accept(response) is true; returns seconds-since-epoch, or None on timeout
+    or once the launched process has exited"""
+    while time.time() < deadline and not exited(process):
+        try:
+            r = session.get(url, timeout=max(interval, 1))
+            if accept(r):
+                return time.time()
+        except Exception:
+            pass  # connection refused while the weights are still loading
+        time.sleep(interval)
+    return None
+
+
+def stream_probe(session, endpoint, model, max_tokens):
+    """One streaming completion; returns (first_token_time, last_token_time, tokens) or None"""
+    payload = {
+        "model": model,
+        "prompt": PROBE_PROMPT,
+        "max_tokens": max_tokens,
+        "temperature": 0,
+        "ignore_eos": True,
+        "stream": True
+    }
+    first = last = None
+    tokens = 0
+    try:
+        response = session.post(f"{endpoint}/v1/completions", json=payload, stream=True, timeout=120)
+        if response.status_code != 200:
+            response.close()
+            return None
+        for line in response.iter_lines():
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith("data: ") or line[6:] == "[DONE]":
+                continue
+            try:
+                choices = json.loads(line[6:]).get('choices') or []
+            except json.JSONDecodeError:
+                continue
+            if choices and choices[0].get('text'):
+                now = time.time()
+                if first is None:
+                    first = now
+                last = now
+                tokens += 1
+    except Exception:
+        return None
+    if first is None:
+        return None
+    return first, last, tokens
+
+
+def is_steady(rates, window, tolerance):
+    """True if the last `window` decode rates are within tolerance of their mean"""
+    if len(rates) < window:
+        return False
+    recent = rates[-window:]
+    mean = sum(recent) / window
+    return mean > 0 and (max(recent) - min(recent)) / mean <= tolerance
+
+
+def watch_backend(endpoint, launch_time, args, result, process=None):
+    """Record readiness milestones for one endpoint into result (seconds since launch)"""
+    session = create_session()
+    deadline = launch_time + args.timeout
+
+    def launch_failed():
+        # No point waiting out --timeout for a server that has already died
+        if exited(process):
+            result['error'] = f"launch command exited with code {process.returncode}"
+            print(f"[{endpoint}] {result['error']} after {time.time() - launch_time:.1f}s")
+            return True
+        return False
+
+    healthy = poll_until(session, f"{endpoint}/health", deadline, args.poll_interval,
+                         lambda r: r.status_code == 200, process)
+    if healthy is None:
+        if not launch_failed():
+            result['error'] = "never became healthy"
+        return
+    result['healthy'] = healthy - launch_time
+    print(f"[{endpoint}] healthy after {result['healthy']:.1f}s")
+
+    models = {}
+
+    def has_models(r):
+        if r.status_code != 200:
+            return False
+        data = r.json().get('data') or []
+        if data:
+            models['id'] = data[0].get('id')
+        return bool(data)
+
+    listed = poll_until(session, f"{endpoint}/v1/models", deadline, args.poll_interval, has_models, process)
+    if listed is None:
+        if not launch_failed():
+            result['error'] = "/v1/models never listed a model"
+        return
+    result['models'] = listed - launch_time
+    result['model'] = args.model or models['id']
+
+    # First token: keep probing until one request streams back content
+    rates = []
+    while time.time() < deadline:
+        if launch_failed():
+            return
+        probe_start = time.time()
+        probe = stream_probe(session, endpoint, result['model'], args.probe_tokens)
+        if probe is None:
+            time.sleep(args.poll_interval)
+            continue
+        first, last, tokens = probe
+        if 'first_token' not in result:
+            result['first_token'] = first - launch_time
+            result['first_ttft'] = first - probe_start
+            print(f"[{endpoint}] first token after {result['first_token']:.1f}s "
+                  f"(request TTFT {result['first_ttft'] * 1000:.0f}ms)")
+        if tokens > 1 and last > first:
+            rates.append((tokens - 1) / (last - first))
+            result['probes'] = len(rates)
+        if is_steady(rates, args.steady_window, args.steady_tolerance):
+            result['steady'] = last - launch_time
+            result['steady_rate'] = sum(rates[-args.steady_window:]) / args.steady_window
+            result['first_rate'] = rates[0]
+            print(f"[{endpoint}] steady decode {result['steady_rate']:.1f} tok/s after {result['steady']:.1f}s")
+            return
+    result['error'] = "decode rate never settled"
+
+
+def fmt(result, key):
+    return f"{result[key]:.1f}s" if key in result else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start and scale-out readiness benchmark')
+    parser.add_argument('--endpoint', action='append', required=True,
+                        help='Backend base URL, e.g. http://192.168.1.1:8000 (repeatable)')
+    parser.add_argument('--launch', action='append', default=[],
+                        help='Command that runs a backend in the foreground, paired with --endpoint by position; '
+                             'all are launched together when the clock starts (repeatable)')
+    parser.add_argument('--keep-running', action='store_true', help='Leave --launch processes running afterwards')
+    parser.add_argument('--model', type=str, default=None, help='Model ID (default: first from /v1/models)')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help='Seconds between readiness polls')
+    parser.add_argument('--timeout', type=float, default=READY_TIMEOUT, help='Seconds to wait for each backend')
+    parser.add_argument('--probe-tokens', type=int, default=PROBE_MAX_TOKENS, help='max_tokens of each decode-rate probe')
+    parser.add_argument('--steady-window', type=int, default=STEADY_WINDOW, help='Consecutive probes that must agree')
+    parser.add_argument('--steady-tolerance', type=float, default=STEADY_TOLERANCE, help='Allowed relative spread within the window')
+    parser.add_argument('--output', type=str, default=None, help='Append results to this CSV file')
+
+    args = parser.parse_args()
+
+    print(f"\n{'='*70}")
+    print(f"vLLM READINESS BENCHMARK")
+    print(f"{'='*70}")
+    print(f"Endpoints:     {len(args.endpoint)}")
+    for endpoint in args.endpoint:
+        print(f"  - {endpoint}")
+    print(f"Launch Cmds:   {len(args.launch)}")
+    print(f"Poll Interval: {args.poll_interval * 1000:.0f}ms")
+    print(f"Steady State:  {args.steady_window} probes of {args.probe_tokens} tokens within {args.steady_tolerance * 100:.0f}%")
+    print(f"{'='*70}\n")
+
+    # The clock starts when the backends are launched (or now, if they are
+    # started externally, e.g. `kubectl scale` right before this script)
+    launch_time = time.time()
+    processes = [subprocess.Popen(shlex.split(cmd), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for cmd in args.launch]
+    print(f"⏱  Clock started at {datetime.now().strftime('%H:%M:%S')}\n")
+
+    # Launch commands pair with endpoints by position; a single command
+    # (e.g. docker compose up) is watched on behalf of every endpoint
+    if len(processes) == len(args.endpoint):
+        watched = processes
+    elif len(processes) == 1:
+        watched = processes * len(args.endpoint)
+    else:
+        if processes:
+            print(f"⚠️  {len(processes)} launch commands for {len(args.endpoint)} endpoints; not watching them for early exit\n")
+        watched = [None] * len(args.endpoint)
+
+    results = {endpoint: {} for endpoint in args.endpoint}
+    threads = [threading.Thread(target=watch_backend, args=(endpoint, launch_time, args, results[endpoint], process))
+               for endpoint, process in zip(args.endpoint, watched)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        if not args.keep_running:
+            for p in processes:
+                p.terminate()
+
+    print(f"\n{'='*70}")
+    print(f"FINAL RESULTS (seconds since launch)")
+    print(f"{'='*70}")
+    print(f"{'Endpoint':<28}{'Healthy':>9}{'Models':>9}{'1st Tok':>9}{'Steady':>9}{'Tok/s':>8}  Status")
+    for endpoint in args.endpoint:
+        r = results[endpoint]
+        rate = f"{r['steady_rate']:.1f}" if 'steady_rate' in r else "-"
+        status = r.get('error', 'ready')
+        print(f"{endpoint:<28}{fmt(r, 'healthy'):>9}{fmt(r, 'models'):>9}{fmt(r, 'first_token'):>9}"
+              f"{fmt(r, 'steady'):>9}{rate:>8}  {status}")
+
+    print()
+    for key, label in (('healthy', 'Healthy'), ('first_token', 'First Token'), ('steady', 'Steady State')):
+        values = [r[key] for r in results.values() if key in r]
+        if values:
+            print(f"{label + ':':<14} first {min(values):.1f}s, all {max(values):.1f}s "
+                  f"({len(values)}/{len(results)} backends, spread {max(values) - min(values):.1f}s)")
+    warmup = [(r['steady_rate'], r['first_rate']) for r in results.values() if 'steady_rate' in r]
+    if warmup:
+        slowdown = sum(steady / first for steady, first in warmup if first > 0) / len(warmup)
+        print(f"Warm-up:       first probe decoded {slowdown:.2f}x slower than steady state (avg)")
+    print(f"{'='*70}\n")
+
+    if args.output:
+        new_file = not os.path.exists(args.output)
+        with open(args.output, 'a', encoding='utf-8') as f:
+            if new_file:
+                f.write("timestamp,endpoint,backends,healthy_s,models_s,first_token_s,first_ttft_s,steady_s,steady_tok_s,status\n")
+            stamp = datetime.fromtimestamp(launch_time).strftime('%Y-%m-%d %H:%M:%S')
+            for endpoint in args.endpoint:
+                r = results[endpoint]
+                cells = [f"{r[k]:.3f}" if k in r else "" for k in
+                         ('healthy', 'models', 'first_token', 'first_ttft', 'steady', 'steady_rate')]
+                f.write(f"{stamp},{endpoint},{len(args.endpoint)},{','.join(cells)},{r.get('error', 'ready')}\n")
+        print(f"Results appended to: {os.path.abspath(args.output)}\n")
+
+    if any('error' in r for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nBenchmark interrupted")
+        sys.exit(0)
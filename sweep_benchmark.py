@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Input-Length x Output-Length Sweep Benchmark for vLLM
+Runs a grid of prompt lengths x max_tokens x concurrency levels with
+synthetic prompts built to exact token counts, forcing every output to
+its target length, and writes a throughput/latency surface to CSV.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+from load_test_utils import create_session, percentile
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:
+    AutoTokenizer = None  # fall back to the server's /tokenize endpoint
+
+# Configuration
+SERVER_HOST = "192.168.1.1"
+SERVER_PORT = "8000"     # a backend directly: nginx only proxies /v1/, not /tokenize
+MODEL_ID = None          # first model from /v1/models unless --model is given
+
+INPUT_LENS = [128, 512, 2048, 4096]
+OUTPUT_LENS = [128, 256, 1024]
+CONCURRENCY_LEVELS = [1, 8, 32]
+MAX_MODEL_LEN = 8192     # vLLM --max-model-len; prompt + max_tokens must fit
+REQUEST_TIMEOUT = 600    # matches proxy_read_timeout in nginx.conf
+
+# Short common words, one token each in most BPE vocabularies, so the
+# prompt length can be tuned a token at a time
+FILLER_WORDS = ("the quick brown fox jumps over a lazy dog while people in the city walk to work "
+                "and read about new ideas in science art music food travel and history").split()
+
+
+class PromptBuilder:
+    """Builds prompts of an exact token count using a local tokenizer or the server's /tokenize"""
+
+    def __init__(self, base_url, model, tokenizer_name=None):
+        self.base_url = base_url
+        self.model = model
+        self.session = create_session()
+        self.tokenizer = None
+        self.word_counts = {}  # target tokens -> filler words that fit
+        if AutoTokenizer is not None:
+            try:
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name or model)
+            except Exception as e:
+                print(f"⚠️  Cannot load tokenizer {tokenizer_name or model}: {str(e)[:100]}")
+        self.source = "local tokenizer" if self.tokenizer else f"{base_url}/tokenize"
+
+    def count(self, text):
+        # Both paths add special tokens (BOS), as /v1/completions does
+        if self.tokenizer:
+            return len(self.tokenizer.encode(text, add_special_tokens=True))
+        r = self.session.post(f"{self.base_url}/tokenize", json={"model": self.model, "prompt": text}, timeout=30)
+        r.raise_for_status()
+        return r.json()['count']
+
+    def text(self, salt, words):
+        return salt + " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(words))
+
+    def build(self, n_tokens, salt=""):
+        """Longest salt + filler prompt with at most n_tokens tokens; returns (prompt, tokens)"""
+        words = self.word_counts.get(n_tokens)
+        if words is None:
+            # Binary search once per length; every word is at least one token
+            lo, hi = 0, n_tokens
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self.count(self.text(salt, mid)) <= n_tokens:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            words = self.word_counts[n_tokens] = lo
+        # A different salt can shift the count by a token or two; nudge the filler to match
+        tokens = self.count(self.text(salt, words))
+        while tokens > n_tokens and words > 0:
+            words -= 1
+            tokens = self.count(self.text(salt, words))
+        while words < n_tokens:
+            longer = self.count(self.text(salt, words + 1))
+            if longer > n_tokens:
+                break
+            words, tokens = words + 1, longer
+        return self.text(salt, words), tokens
+
+
+def send_request(session, base_url, model, prompt, max_tokens):
+    """One streaming completion forced to max_tokens; returns a result dict"""
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "min_tokens": max_tokens,
+        "ignore_eos": True,
+        "temperature": 0.7,
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    }
+    start = time.time()
+    first_token = None
+    chunks = 0
+    usage = {}
+    try:
+        response = session.post(f"{base_url}/v1/completions", json=payload, stream=True, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            response.close()
+            return {'ok': False, 'error': error}
+        for line in response.iter_lines():
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith("data: ") or line[6:] == "[DONE]":
+                continue
+            try:
+                data = json.loads(line[6:])
+            except json.JSONDecodeError:
+                continue
+            if data.get('usage'):
+                usage = data['usage']
+            choices = data.get('choices') or []
+            if choices and choices[0].get('text'):
+                if first_token is None:
+                    first_token = time.time()
+                chunks += 1
+    except Exception as e:
+        return {'ok': False, 'error': str(e)[:200]}
+    end = time.time()
+    if first_token is None:
+        return {'ok': False, 'error': "no tokens received"}
+    # Chunks undercount tokens when the server batches several per chunk
+    output_tokens = usage.get('completion_tokens') or chunks
+    return {
+        'ok': True,
+        'ttft': first_token - start,
+        'e2e': end - start,
+        'tpot': (end - first_token) / (output_tokens - 1) if output_tokens > 1 else None,
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'output_tokens': output_tokens,
+        'start': start,
+        'end': end
+    }
+
+
+def run_point(base_url, model, builder, input_len, output_len, concurrency, num_requests, seq):
+    """Run one grid point closed-loop at the given concurrency and return its summary row"""
+    # A unique salt per request keeps vLLM's prefix cache from skipping prefill
+    work = queue.Queue()
+    built_tokens = []
+    for i in range(num_requests):
+        prompt, tokens = builder.build(input_len, salt=f"{seq + i}: ")
+        built_tokens.append(tokens)
+        work.put(prompt)
+
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        session = create_session()
+        while True:
+            try:
+                prompt = work.get_nowait()
+            except queue.Empty:
+                break
+            result = send_request(session, base_url, model, prompt, output_len)
+            with lock:
+                results.append(result)
+        session.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(concurrency, num_requests))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ok = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        print(f"    ✗ {len(failed)} failed, e.g. {failed[0]['error']}")
+    row = {
+        'model': model,
+        'input_len': input_len,
+        'output_len': output_len,
+        'concurrency': concurrency,
+        'requests': len(ok),
+        'failed': len(failed),
+        'prompt_tokens': sum(built_tokens) / len(built_tokens),
+    }
+    if not ok:
+        return row
+
+    elapsed = max(r['end'] for r in ok) - min(r['start'] for r in ok)
+    output_tokens = sum(r['output_tokens'] for r in ok)
+    server_prompt = [r['prompt_tokens'] for r in ok if r['prompt_tokens'] is not None]
+    if server_prompt:
+        row['prompt_tokens'] = sum(server_prompt) / len(server_prompt)
+    ttfts = [r['ttft'] for r in ok]
+    tpots = [r['tpot'] for r in ok if r['tpot'] is not None]
+    e2es = [r['e2e'] for r in ok]
+    row.update({
+        'output_tokens': output_tokens / len(ok),
+        'short_outputs': sum(1 for r in ok if r['output_tokens'] < output_len),
+        'elapsed': elapsed,
+        'requests_per_sec': len(ok) / elapsed,
+        'output_tps': output_tokens / elapsed,
+        'total_tps': (output_tokens + row['prompt_tokens'] * len(ok)) / elapsed,
+        'ttft_p50': percentile(ttfts, 0.5),
+        'ttft_p99': percentile(ttfts, 0.99),
+        'tpot_p50': percentile(tpots, 0.5),
+        'tpot_p99': percentile(tpots, 0.99),
+        'e2e_p50': percentile(e2es, 0.5),
+        'e2e_p99': percentile(e2es, 0.99),
+    })
+    if row['short_outputs']:
+        print(f"    ⚠️  {row['short_outputs']} outputs shorter than {output_len} tokens (ignore_eos/min_tokens not honoured?)")
+    return row
+
+
+CSV_COLUMNS = ['timestamp', 'model', 'input_len', 'output_len', 'concurrency', 'requests', 'failed',
+               'prompt_tokens', 'output_tokens', 'short_outputs', 'elapsed', 'requests_per_sec',
+               'output_tps', 'total_tps', 'ttft_p50', 'ttft_p99', 'tpot_p50', 'tpot_p99', 'e2e_p50', 'e2e_p99']
+
+
+def append_csv(path, rows, timestamp):
+    new_file = not os.path.exists(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        if new_file:
+            f.write(",".join(CSV_COLUMNS) + "\n")
+        for row in rows:
+            cells = []
+            for col in CSV_COLUMNS:
+                value = timestamp if col == 'timestamp' else row.get(col)
+                if value is None:
+                    cells.append("")
+                elif isinstance(value, float):
+                    cells.append(f"{value:.4f}")
+                else:
+                    cells.append(str(value))
+            f.write(",".join(cells) + "\n")
+
+
+def print_model_summary(model, rows, concurrency_levels):
+    """Output tok/s and p50 TTFT per (input, output) row and concurrency column"""
+    print(f"\n{'='*70}")
+    print(f"SWEEP SUMMARY: {model}")
+    print(f"{'='*70}")
+    print("Cells: output tok/s / p50 TTFT / p50 TPOT")
+    header = f"{'Input/Output':<14}" + "".join(f"{f'c={c}':>26}" for c in concurrency_levels)
+    print(header)
+    print("-" * len(header))
+    by_point = {(r['input_len'], r['output_len'], r['concurrency']): r for r in rows}
+    for input_len, output_len in sorted({(r['input_len'], r['output_len']) for r in rows}):
+        line = f"{f'{input_len}/{output_len}':<14}"
+        for c in concurrency_levels:
+            r = by_point.get((input_len, output_len, c))
+            if not r or 'output_tps' not in r:
+                cell = "-"
+            else:
+                tpot = f"{r['tpot_p50'] * 1000:.1f}ms" if r['tpot_p50'] is not None else "-"
+                cell = f"{r['output_tps']:.0f} / {r['ttft_p50'] * 1000:.0f}ms / {tpot}"
+            line += f"{cell:>26}"
+        print(line)
+    best = max((r for r in rows if 'output_tps' in r), key=lambda r: r['output_tps'], default=None)
+    if best:
+        print(f"\nPeak output throughput: {best['output_tps']:.0f} tok/s at "
+              f"{best['input_len']} in / {best['output_len']} out, concurrency {best['concurrency']}")
+    print(f"{'='*70}\n")
+
+
+def get_models(base_url):
+    """Models served at base_url with their max_model_len, if reported"""
+    try:
+        r = create_session().get(f"{base_url}/v1/models", timeout=10)
+        if r.status_code == 200:
+            return {m.get('id'): m.get('max_model_len') for m in r.json().get('data') or []}
+    except Exception as e:
+        print(f"❌ Cannot connect to server: {e}")
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Input-length x output-length x concurrency sweep benchmark')
+    parser.add_argument('--server', type=str, default=SERVER_HOST, help='Server IP')
+    parser.add_argument('--port', type=str, default=SERVER_PORT, help='Server port')
+    parser.add_argument('--model', action='append', default=[],
+                        help='Model ID to sweep (repeatable; default: first from /v1/models)')
+    parser.add_argument('--tokenizer', type=str, default=None,
+                        help='Hugging Face tokenizer name or path (default: the model ID; falls back to /tokenize)')
+    parser.add_argument('--input-lens', type=int, nargs='+', default=INPUT_LENS, help='Prompt lengths in tokens')
+    parser.add_argument('--output-lens', type=int, nargs='+', default=OUTPUT_LENS, help='Output lengths (max_tokens)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=CONCURRENCY_LEVELS, help='Requests in flight')
+    parser.add_argument('--num-requests', type=int, default=0,
+                        help='Requests per grid point (default: 2x concurrency, at least 4)')
+    parser.add_argument('--max-model-len', type=int, default=MAX_MODEL_LEN,
+                        help='Context length, used when /v1/models does not report one')
+    parser.add_argument('--output', type=str, default='sweep_results.csv', help='Append the surface to this CSV file')
+
+    args = parser.parse_args()
+    base_url = f"http://{args.server}:{args.port}"
+
+    served = get_models(base_url)
+    if not served:
+        sys.exit(1)
+    models = args.model or [next(iter(served))]
+    points = [(i, o, c) for i in sorted(args.input_lens) for o in sorted(args.output_lens)
+              for c in sorted(args.concurrency)]
+
+    print(f"\n{'='*70}")
+    print(f"vLLM SWEEP BENCHMARK")
+    print(f"{'='*70}")
+    print(f"Server:        {base_url}")
+    print(f"Models:        {', '.join(models)}")
+    print(f"Input Lens:    {' '.join(map(str, sorted(args.input_lens)))}")
+    print(f"Output Lens:   {' '.join(map(str, sorted(args.output_lens)))}")
+    print(f"Concurrency:   {' '.join(map(str, sorted(args.concurrency)))}")
+    print(f"Grid Points:   {len(points)} per model")
+    print(f"Output CSV:    {os.path.abspath(args.output)}")
+    print(f"{'='*70}\n")
+
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    seq = 0
+    for model in models:
+        max_model_len = served.get(model) or args.max_model_len
+        builder = PromptBuilder(base_url, model, args.tokenizer)
+        print(f"▶ {model} (max_model_len {max_model_len}, token counts from {builder.source})")
+
+        rows = []
+        skipped = set()
+        for input_len, output_len, concurrency in points:
+            if input_len + output_len > max_model_len:
+                if (input_len, output_len) not in skipped:
+                    skipped.add((input_len, output_len))
+                    print(f"  skip {input_len} in / {output_len} out: exceeds max_model_len {max_model_len}")
+                continue
+            num_requests = args.num_requests or max(2 * concurrency, 4)
+            print(f"  {input_len} in / {output_len} out, concurrency {concurrency}: {num_requests} requests")
+            try:
+                row = run_point(base_url, model, builder, input_len, output_len, concurrency, num_requests, seq)
+            except Exception as e:
+                print(f"    ✗ Cannot build prompts: {str(e)[:200]}")
+                continue
+            seq += num_requests
+            if 'output_tps' in row:
+                print(f"    {row['output_tps']:.0f} output tok/s, TTFT p50 {row['ttft_p50'] * 1000:.0f}ms, "
+                      f"E2E p50 {row['e2e_p50']:.1f}s")
+            rows.append(row)
+            append_csv(args.output, [row], timestamp)
+
+        print_model_summary(model, rows, sorted(args.concurrency))
+
+    print(f"Surface appended to: {os.path.abspath(args.output)}\n")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nSweep interrupted")
+        sys.exit(0)
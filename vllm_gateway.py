@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+Coalescing Gateway for vLLM Backends
+Sits between Nginx and the vLLM servers listed in vllm_backends.conf.
+Concurrent identical deterministic requests share one upstream generation;
+the SSE chunks are fanned out to every attached client as they arrive.
+Admission control keeps estimated in-flight tokens per backend under a
+budget and enforces per-client token-bucket rate limits.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Configuration
+LISTEN_HOST = "0.0.0.0"
+LISTEN_PORT = 9000
+BACKENDS_FILE = "/etc/nginx/upstreams/vllm_backends.conf"
+UPSTREAM_CONNECT_TIMEOUT = 5    # Matches proxy_connect_timeout in nginx.conf
+UPSTREAM_READ_TIMEOUT = 600     # Matches proxy_read_timeout in nginx.conf
+MAX_FAILS = 3                   # Matches max_fails in vllm_backends.conf
+FAIL_TIMEOUT = 30               # Matches fail_timeout in vllm_backends.conf
+UPSTREAM_TRIES = 2              # Matches proxy_next_upstream_tries in nginx.conf
+RETRY_STATUSES = (502, 503, 504)  # Matches proxy_next_upstream in nginx.conf
+
+# Admission control
+BACKEND_TOKEN_BUDGET = 32768    # Estimated prompt+output tokens in flight per backend
+QUEUE_TIMEOUT = 30              # Seconds a request may wait for budget before 429
+MAX_QUEUE = 256                 # Requests waiting for budget before immediate 429
+CLIENT_RATE = 0                 # Tokens/second refilled per client (0 = no per-client limit)
+CLIENT_BURST = 4096             # Token bucket capacity per client
+DEFAULT_MAX_TOKENS = 512        # Output estimate when a request sets no max_tokens
+CHARS_PER_TOKEN = 4             # Rough prompt-length estimate without a tokenizer
+
+COALESCE_PATHS = ("/v1/chat/completions", "/v1/completions")
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'content-length', 'host'
+}
+
+
+def load_backends(path):
+    """Parse active 'server host:port' lines from an nginx upstream file"""
+    backends = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            match = re.match(r'server\s+([^\s;]+)', line)
+            if match:
+                backends.append(f"http://{match.group(1)}")
+    return backends
+
+
+def is_cacheable(path, body):
+    """A request may be shared only if its output is fully deterministic"""
+    if path not in COALESCE_PATHS or not isinstance(body, dict):
+        return False
+    if body.get('temperature') != 0:
+        return False
+    if body.get('n', 1) != 1 or body.get('best_of', 1) != 1:
+        return False
+    return True
+
+
+def _prompt_tokens(prompt):
+    """Token IDs count as themselves; text is estimated from its length"""
+    if isinstance(prompt, list):
+        return len(prompt)
+    return math.ceil(len(str(prompt)) / CHARS_PER_TOKEN)
+
+
+def estimate_tokens(body):
+    """Estimate prompt+output tokens a request will hold in the KV cache"""
+    if not isinstance(body, dict):
+        return DEFAULT_MAX_TOKENS
+    try:
+        if 'messages' in body:
+            prompts = ["".join(str(m.get('content', '')) for m in body.get('messages') or [] if isinstance(m, dict))]
+        else:
+            prompt = body.get('prompt', '')
+            if isinstance(prompt, list) and prompt and not all(isinstance(p, int) for p in prompt):
+                prompts = prompt  # a batch: list of strings or of token-ID lists
+            else:
+                prompts = [prompt]  # one string or one token-ID list
+        prompt_tokens = sum(_prompt_tokens(p) for p in prompts)
+        # Every prompt generates n (or best_of) sequences of up to max_tokens
+        sequences = max(int(body.get('n') or 1), int(body.get('best_of') or 1))
+        output_tokens = int(body.get('max_tokens') or DEFAULT_MAX_TOKENS) * len(prompts) * sequences
+        return prompt_tokens + output_tokens
+    except (TypeError, ValueError, AttributeError):
+        # Malformed bodies are left for the backend to reject
+        return DEFAULT_MAX_TOKENS
+
+
+def client_key(headers, client_address):
+    """Identify a client by API key, then X-Real-IP, then socket address"""
+    auth = headers.get('Authorization', '')
+    if auth.startswith('Bearer ') and len(auth) > 7:
+        return "key:" + hashlib.sha256(auth[7:].encode('utf-8')).hexdigest()[:16]
+    return "ip:" + (headers.get('X-Real-IP') or client_address)
+
+
+def coalesce_key(path, body, authorization=''):
+    """Canonical hash of the endpoint, request body and credentials"""
+    # Only the leader's Authorization is forwarded upstream, so requests
+    # with different credentials must never share a generation
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{path}\n{authorization}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+class GatewayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client_requests = 0
+        self.upstream_requests = 0
+        self.coalesced_requests = 0
+        self.client_disconnects = 0
+        self.upstream_cancelled = 0
+        self.upstream_errors = 0
+        self.rate_limited = 0
+        self.over_budget = 0
+        self.queued = 0
+        self.total_queue_wait = 0
+        self.upstream_retries = 0
+        self.backend_requests = {}
+
+    def record_client(self, coalesced):
+        with self.lock:
+            self.client_requests += 1
+            if coalesced:
+                self.coalesced_requests += 1
+
+    def record_upstream(self, backend):
+        with self.lock:
+            self.upstream_requests += 1
+            self.backend_requests[backend] = self.backend_requests.get(backend, 0) + 1
+
+    def record_disconnect(self):
+        with self.lock:
+            self.client_disconnects += 1
+
+    def record_cancelled(self):
+        with self.lock:
+            self.upstream_cancelled += 1
+
+    def record_upstream_error(self):
+        with self.lock:
+            self.upstream_errors += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.upstream_retries += 1
+
+    def record_rejected(self, reason):
+        with self.lock:
+            if reason == 'rate_limited':
+                self.rate_limited += 1
+            else:
+                self.over_budget += 1
+
+    def record_queued(self, wait):
+        with self.lock:
+            self.queued += 1
+            self.total_queue_wait += wait
+
+    def summary(self):
+        with self.lock:
+            reduction = self.coalesced_requests / self.client_requests * 100 if self.client_requests > 0 else 0
+            return {
+                'client_requests': self.client_requests,
+                'upstream_requests': self.upstream_requests,
+                'coalesced_requests': self.coalesced_requests,
+                'client_disconnects': self.client_disconnects,
+                'upstream_cancelled': self.upstream_cancelled,
+                'upstream_errors': self.upstream_errors,
+                'upstream_retries': self.upstream_retries,
+                'rate_limited': self.rate_limited,
+                'over_budget': self.over_budget,
+                'queued': self.queued,
+                'avg_queue_wait': self.total_queue_wait / self.queued if self.queued > 0 else 0,
+                'backend_load_reduction': reduction,
+                'backend_requests': dict(self.backend_requests)
+            }
+
+
+class BackendHealth:
+    """Passive health checks like Nginx's max_fails/fail_timeout"""
+
+    def __init__(self, backends, max_fails=MAX_FAILS, fail_timeout=FAIL_TIMEOUT):
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.lock = threading.Lock()
+        self.fails = {backend: (0, 0) for backend in backends}  # (count, first failure time)
+        self.down_until = {backend: 0 for backend in backends}
+
+    def record_failure(self, backend):
+        now = time.time()
+        with self.lock:
+            count, since = self.fails[backend]
+            if now - since > self.fail_timeout:
+                count, since = 0, now
+            count += 1
+            if count >= self.max_fails:
+                self.down_until[backend] = now + self.fail_timeout
+                count = 0
+                print(f"[Gateway] {backend} marked down for {self.fail_timeout}s after {self.max_fails} failures")
+            self.fails[backend] = (count, since)
+
+    def record_success(self, backend):
+        with self.lock:
+            self.fails[backend] = (0, 0)
+
+    def is_up(self, backend):
+        with self.lock:
+            return time.time() >= self.down_until[backend]
+
+    def available(self, backends):
+        """Backends not marked down; all of them if every one is down, as Nginx does"""
+        up = [backend for backend in backends if self.is_up(backend)]
+        return up or list(backends)
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return {'backends_down': [b for b, until in self.down_until.items() if until > now]}
+
+
+class ClientRateLimiter:
+    """Per-client token buckets, charged with each request's estimated tokens"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def try_acquire(self, client, cost):
+        """Return 0 if admitted, otherwise the seconds until the bucket can cover cost"""
+        cost = min(cost, self.burst)
+        now = time.time()
+        with self.lock:
+            tokens, last = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                self.buckets[client] = (tokens - cost, now)
+                return 0
+            self.buckets[client] = (tokens, now)
+            return (cost - tokens) / self.rate
+
+
+class AdmissionController:
+    """Tracks estimated in-flight tokens per backend and queues above budget"""
+
+    def __init__(self, backends, budget, queue_timeout, max_queue, health=None):
+        self.health = health
+        self.budget = budget
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.cond = threading.Condition()
+        self.inflight = {backend: 0 for backend in backends}
+        self.waiting = 0
+
+    def _pick(self, cost, exclude):
+        # Least-loaded healthy backend that still has room; an oversized
+        # request is admitted alone onto an idle backend rather than
+        # rejected forever. A dead backend fails instantly and so always
+        # looks idle, hence the health filter.
+        candidates = [b for b in self.inflight if b not in exclude] or list(self.inflight)
+        if self.health:
+            candidates = self.health.available(candidates)
+        backend = min(candidates, key=self.inflight.get)
+        if self.inflight[backend] + cost <= self.budget or self.inflight[backend] == 0:
+            return backend
+        return None
+
+    def acquire(self, cost, exclude=()):
+        """Return (backend, wait_seconds); backend is None if the request must be rejected"""
+        start = time.time()
+        deadline = start + self.queue_timeout
+        with self.cond:
+            backend = self._pick(cost, exclude)
+            if backend is not None:
+                self.inflight[backend] += cost
+                return backend, 0
+            if self.waiting >= self.max_queue:
+                return None, 0
+            self.waiting += 1
+            try:
+                while backend is None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None, time.time() - start
+                    self.cond.wait(remaining)
+                    backend = self._pick(cost, exclude)
+            finally:
+                self.waiting -= 1
+            self.inflight[backend] += cost
+            return backend, time.time() - start
+
+    def release(self, backend, cost):
+        with self.cond:
+            self.inflight[backend] -= cost
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            return {'inflight_tokens': dict(self.inflight), 'waiting': self.waiting}
+
+
+class SharedGeneration:
+    """One upstream response whose body chunks are replayed to every subscriber"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.status = None
+        self.headers = []
+        self.chunks = []
+        self.done = False
+        self.subscribers = 0
+        self.cancelled = False
+
+    def attach(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def detach(self):
+        """Drop one subscriber; returns True if that was the last one and the generation is unfinished"""
+        with self.cond:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.cancelled = True
+            return self.cancelled
+
+    def set_headers(self, status, headers):
+        with self.cond:
+            self.status = status
+            self.headers = headers
+            self.cond.notify_all()
+
+    def append(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def wait_headers(self):
+        with self.cond:
+            while self.status is None:
+                self.cond.wait()
+            return self.status, self.headers
+
+    def subscribe(self):
+        """Yield every chunk from the start, blocking until new ones arrive"""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done:
+                    self.cond.wait()
+                if index >= len(self.chunks):
+                    return
+                pending = self.chunks[index:]
+                index = len(self.chunks)
+            for chunk in pending:
+                yield chunk
+
+
+class Gateway:
+    def __init__(self, backends, coalesce=True, admission=None, rate_limiter=None, retry_after=QUEUE_TIMEOUT,
+                 health=None):
+        if not backends:
+            raise ValueError("No backends configured")
+        self.backends = backends
+        self.health = health or BackendHealth(backends)
+        self.coalesce = coalesce
+        self.admission = admission
+        self.rate_limiter = rate_limiter
+        self.retry_after = retry_after
+        self.stats = GatewayStats()
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self._rr = itertools.cycle(backends)
+
+    def next_backend(self, exclude=()):
+        """Round-robin over healthy backends, skipping those already tried"""
+        candidates = self.health.available([b for b in self.backends if b not in exclude] or self.backends)
+        with self.lock:
+            for _ in range(len(self.backends)):
+                backend = next(self._rr)
+                if backend in candidates:
+                    return backend
+        return candidates[0]
+
+    def start(self, path, raw_body, headers, key=None, cost=0):
+        """Return (generation, coalesced) for a request, starting upstream work if needed"""
+        if key is not None:
+            with self.lock:
+                gen = self.inflight.get(key)
+                if gen is not None:
+                    gen.attach()
+                    self.stats.record_client(coalesced=True)
+                    return gen, True
+                gen = SharedGeneration()
+                gen.attach()
+                self.inflight[key] = gen
+        else:
+            gen = SharedGeneration()
+            gen.attach()
+
+        self.stats.record_client(coalesced=False)
+        # The upstream read runs on its own thread so that no single client
+        # disconnect can cancel a generation other clients are attached to;
+        # it is only cancelled once every subscriber has gone.
+        worker = threading.Thread(target=self._fetch, args=(gen, key, path, raw_body, headers, cost), daemon=True)
+        worker.start()
+        return gen, False
+
+    def detach(self, gen, key):
+        """Called when a client disconnects; cancels the upstream read if nobody is left"""
+        with self.lock:
+            if gen.detach() and key is not None and self.inflight.get(key) is gen:
+                # New identical requests must start a fresh generation
+                del self.inflight[key]
+
+    def _fetch(self, gen, key, path, raw_body, headers, cost):
+        tried = []
+        try:
+            for attempt in range(UPSTREAM_TRIES):
+                if gen.cancelled:
+                    return
+                # Like proxy_next_upstream: one retry on another backend,
+                # only while nothing has been sent to the client yet
+                last = attempt == UPSTREAM_TRIES - 1 or len(tried) + 1 >= len(self.backends)
+                if self.admission:
+                    backend, wait = self.admission.acquire(cost, exclude=tried)
+                    if backend is None:
+                        # Followers attached to this generation receive the same 429
+                        self.stats.record_rejected('over_budget')
+                        body = json.dumps({'error': {'message': "Backends are at their token budget", 'type': 'over_budget'}})
+                        gen.set_headers(429, [('Content-Type', 'application/json'), ('Retry-After', str(self.retry_after))])
+                        gen.append(body.encode('utf-8'))
+                        return
+                    if wait > 0:
+                        self.stats.record_queued(wait)
+                else:
+                    backend = self.next_backend(exclude=tried)
+                self.stats.record_upstream(backend)
+                try:
+                    if self._proxy(gen, backend, path, raw_body, headers, last):
+                        return
+                finally:
+                    if self.admission:
+                        self.admission.release(backend, cost)
+                tried.append(backend)
+                self.stats.record_retry()
+        finally:
+            self._finish(gen, key)
+
+    def _proxy(self, gen, backend, path, raw_body, headers, last):
+        """Stream one upstream attempt into gen; returns False if it failed before headers and may be retried"""
+        try:
+            response = requests.post(
+                f"{backend}{path}",
+                headers=headers,
+                data=raw_body,
+                stream=True,
+                timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+            )
+        except Exception as e:
+            self.stats.record_upstream_error()
+            self.health.record_failure(backend)
+            print(f"[Gateway] Upstream {backend} error: {e}")
+            if not last:
+                return False
+            body = json.dumps({'error': {'message': f"Upstream error: {e}", 'type': 'bad_gateway'}})
+            gen.set_headers(502, [('Content-Type', 'application/json')])
+            gen.append(body.encode('utf-8'))
+            return True
+
+        if response.status_code in RETRY_STATUSES:
+            self.stats.record_upstream_error()
+            self.health.record_failure(backend)
+            if not last:
+                response.close()
+                return False
+        else:
+            self.health.record_success(backend)
+        try:
+            forwarded = [(k, v) for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+            # Same header Nginx adds, so load tests can attribute requests to a backend
+            forwarded.append(('X-Upstream-Addr', backend.split('://', 1)[-1]))
+            gen.set_headers(response.status_code, forwarded)
+            for chunk in response.iter_content(chunk_size=None):
+                if gen.cancelled:
+                    # Closing the upstream connection makes vLLM abort the
+                    # request and free its batch slot.
+                    response.close()
+                    self.stats.record_cancelled()
+                    break
+                if chunk:
+                    gen.append(chunk)
+        except Exception as e:
+            # Headers are already out, so the stream just ends here
+            self.stats.record_upstream_error()
+            print(f"[Gateway] Upstream {backend} error: {e}")
+        return True
+
+    def _finish(self, gen, key):
+        gen.finish()
+        if key is not None:
+            with self.lock:
+                if self.inflight.get(key) is gen:
+                    del self.inflight[key]
+
+
+def make_handler(gateway):
+    class GatewayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # Keep-alive clients may drop idle connections at any time
+                self.close_connection = True
+
+        def _send_json(self, status, obj):
+            data = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, data):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/gateway/stats':
+                summary = gateway.stats.summary()
+                if gateway.admission:
+                    summary.update(gateway.admission.snapshot())
+                summary.update(gateway.health.snapshot())
+                self._send_json(200, summary)
+                return
+            # /health, /v1/models etc. are passed through to any backend
+            backend = gateway.next_backend()
+            try:
+                r = requests.get(f"{backend}{self.path}", timeout=UPSTREAM_CONNECT_TIMEOUT)
+                self.send_response(r.status_code)
+                self.send_header('Content-Type', r.headers.get('Content-Type', 'application/json'))
+                self.send_header('Content-Length', str(len(r.content)))
+                self.end_headers()
+                self.wfile.write(r.content)
+            except Exception as e:
+                self._send_json(502, {'error': {'message': f"Upstream error: {e}", 'type': 'bad_gateway'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            raw_body = self.rfile.read(length) if length > 0 else b''
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+            except json.JSONDecodeError:
+                body = None
+
+            cost = estimate_tokens(body)
+            if gateway.rate_limiter:
+                delay = gateway.rate_limiter.try_acquire(client_key(self.headers, self.client_address[0]), cost)
+                if delay > 0:
+                    gateway.stats.record_rejected('rate_limited')
+                    data = json.dumps({'error': {'message': "Client token rate limit exceeded", 'type': 'rate_limited'}}).encode('utf-8')
+                    self.send_response(429)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Retry-After', str(math.ceil(delay)))
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+            key = None
+            if gateway.coalesce and is_cacheable(self.path, body):
+                key = coalesce_key(self.path, body, self.headers.get('Authorization', ''))
+
+            upstream_headers = {'Content-Type': self.headers.get('Content-Type', 'application/json')}
+            if self.headers.get('Authorization'):
+                upstream_headers['Authorization'] = self.headers['Authorization']
+
+            gen, coalesced = gateway.start(self.path, raw_body, upstream_headers, key, cost)
+            status, headers = gen.wait_headers()
+
+            try:
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('X-Gateway-Coalesced', 'true' if coalesced else 'false')
+                self.end_headers()
+                for chunk in gen.subscribe():
+                    self._write_chunk(chunk)
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Only this subscriber goes away; the shared generation keeps
+                # running while anyone else is still attached to it
+                gateway.stats.record_disconnect()
+                gateway.detach(gen, key)
+                self.close_connection = True
+
+    return GatewayHandler
+
+
+def print_stats_periodic(gateway, interval):
+    """Print gateway statistics"""
+    while True:
+        time.sleep(interval)
+        s = gateway.stats.summary()
+        print(f"\n{'='*60}")
+        print(f"GATEWAY @ {datetime.now().strftime('%H:%M:%S')}")
+        print(f"{'='*60}")
+        print(f"Client Requests:    {s['client_requests']}")
+        print(f"Upstream Requests:  {s['upstream_requests']}")
+        print(f"Coalesced:          {s['coalesced_requests']}")
+        print(f"Backend Load Saved: {s['backend_load_reduction']:.1f}%")
+        print(f"Client Disconnects: {s['client_disconnects']}")
+        print(f"Upstream Cancelled: {s['upstream_cancelled']}")
+        print(f"Upstream Errors:    {s['upstream_errors']} ({s['upstream_retries']} retried)")
+        print(f"Rate Limited (429): {s['rate_limited']}")
+        print(f"Over Budget (429):  {s['over_budget']}")
+        print(f"Queued:             {s['queued']} (avg wait {s['avg_queue_wait']:.2f}s)")
+        print(f"{'='*60}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Coalescing gateway in front of vLLM backends')
+    parser.add_argument('--host', type=str, default=LISTEN_HOST, help='Listen address')
+    parser.add_argument('--port', type=int, default=LISTEN_PORT, help='Listen port')
+    parser.add_argument('--backends-file', type=str, default=BACKENDS_FILE, help='Nginx upstream file to read backends from')
+    parser.add_argument('--backend', action='append', default=[], help='Backend URL (repeatable, overrides --backends-file)')
+    parser.add_argument('--no-coalesce', action='store_true', help='Disable request coalescing (baseline runs)')
+    parser.add_argument('--no-admission', action='store_true', help='Disable budget admission and rate limiting (baseline runs)')
+    parser.add_argument('--token-budget', type=int, default=BACKEND_TOKEN_BUDGET, help='Estimated in-flight tokens allowed per backend')
+    parser.add_argument('--queue-timeout', type=int, default=QUEUE_TIMEOUT, help='Seconds to queue for budget before 429')
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE, help='Queued requests before immediate 429')
+    parser.add_argument('--client-rate', type=float, default=CLIENT_RATE, help='Per-client tokens/second (default 0: disabled)')
+    parser.add_argument('--client-burst', type=int, default=CLIENT_BURST, help='Per-client token bucket size')
+    parser.add_argument('--max-fails', type=int, default=MAX_FAILS, help='Failures within --fail-timeout before a backend is marked down')
+    parser.add_argument('--fail-timeout', type=int, default=FAIL_TIMEOUT, help='Seconds a failed backend is marked down')
+    parser.add_argument('--stats-interval', type=int, default=30, help='Seconds between stats printouts')
+
+    args = parser.parse_args()
+
+    backends = args.backend or load_backends(args.backends_file)
+    health = BackendHealth(backends, args.max_fails, args.fail_timeout)
+    admission = None
+    rate_limiter = None
+    if not args.no_admission:
+        admission = AdmissionController(backends, args.token_budget, args.queue_timeout, args.max_queue, health)
+        if args.client_rate > 0:
+            rate_limiter = ClientRateLimiter(args.client_rate, args.client_burst)
+    gateway = Gateway(backends, coalesce=not args.no_coalesce, admission=admission,
+                      rate_limiter=rate_limiter, retry_after=args.queue_timeout, health=health)
+
+    print(f"\n{'='*60}")
+    print(f"vLLM COALESCING GATEWAY")
+    print(f"{'='*60}")
+    print(f"Listening:     http://{args.host}:{args.port}")
+    print(f"Coalescing:    {'enabled' if gateway.coalesce else 'disabled'}")
+    if admission:
+        print(f"Token Budget:  {args.token_budget} tokens/backend (queue {args.queue_timeout}s, max {args.max_queue})")
+        if rate_limiter:
+            print(f"Client Limit:  {args.client_rate:g} tokens/s, burst {args.client_burst}")
+        else:
+            print(f"Client Limit:  disabled")
+    else:
+        print(f"Admission:     disabled")
+    print(f"Backends:      {len(backends)} (down after {args.max_fails} failures for {args.fail_timeout}s)")
+    for backend in backends:
+        print(f"  - {backend}")
+    print(f"{'='*60}\n")
+
+    stats_thread = threading.Thread(target=print_stats_periodic, args=(gateway, args.stats_interval), daemon=True)
+    stats_thread.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(gateway))
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\nGateway stopped")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
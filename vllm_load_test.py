@@ -12,6 +12,10 @@ import random
 import sys
 from collections import defaultdict
 
+from load_test_utils import (SLO_TPOT, SLO_TTFT, PhaseTimer, SLOTracker, create_session, format_phases,
+                             parse_retry_after, print_goodput_line, print_phase_breakdown, print_slo_report,
+                             summarize_phases)
+
 # Configuration
 SERVER_HOST = "192.168.1.1"
 SERVER_PORT = "8000"
@@ -22,6 +26,11 @@ NUM_USERS = 50
 TEST_DURATION = 300  # 5 minutes
 MESSAGES_PER_USER = 10
 DELAY_BETWEEN_MESSAGES = (3, 8)  # Random seconds between messages
+KEEPALIVE = True  # Reuse one pooled connection per user; False opens a new one per message
+
+# Service-level objectives (TTFT/TPOT from load_test_utils); only requests
+# meeting all of them count towards goodput
+SLO_E2E = 60      # Seconds for the whole response
 
 # Sample messages for testing
 TEST_MESSAGES = [
@@ -54,23 +63,37 @@ class Stats:
         self.response_times = []
         self.streaming_errors = 0
         self.connection_errors = 0
+        self.rejected = 0
         self.active_users = 0
+        self.phase_samples = defaultdict(list)
+        self.connections_opened = 0
         self.user_stats = defaultdict(lambda: {'sent': 0, 'completed': 0, 'failed': 0})
+        self.slo = SLOTracker(ttft=SLO_TTFT, tpot=SLO_TPOT, e2e=SLO_E2E)
     
     def record_sent(self, user_id):
         with self.lock:
             self.messages_sent += 1
             self.user_stats[user_id]['sent'] += 1
     
-    def record_completed(self, user_id, response_time, tokens):
+    def record_completed(self, user_id, response_time, tokens, phases=None, backend=None):
+        self.slo.record(user_id, backend, phases, tokens, response_time)
         with self.lock:
+            if phases:
+                for name, value in phases.items():
+                    if value is not None:
+                        self.phase_samples[name].append(value)
             self.messages_completed += 1
             self.total_response_time += response_time
             self.response_times.append(response_time)
             self.total_tokens_received += tokens
             self.user_stats[user_id]['completed'] += 1
     
-    def record_failed(self, user_id, error_type='general'):
+    def record_connection(self):
+        with self.lock:
+            self.connections_opened += 1
+    
+    def record_failed(self, user_id, error_type='general', backend=None):
+        self.slo.record(user_id, backend, success=False)
         with self.lock:
             self.messages_failed += 1
             self.user_stats[user_id]['failed'] += 1
@@ -79,6 +102,12 @@ class Stats:
             elif error_type == 'connection':
                 self.connection_errors += 1
     
+    def record_rejected(self, user_id):
+        # A 429 is an SLO miss but not a failure; it is counted separately
+        self.slo.record(user_id, success=False)
+        with self.lock:
+            self.rejected += 1
+    
     def increment_active(self):
         with self.lock:
             self.active_users += 1
@@ -112,6 +141,9 @@ class Stats:
                 'avg_tokens': avg_tokens,
                 'streaming_errors': self.streaming_errors,
                 'connection_errors': self.connection_errors,
+                'rejected': self.rejected,
+                'connections_opened': self.connections_opened,
+                'phases': summarize_phases(self.phase_samples),
                 'percentiles': percentiles
             }
 
@@ -140,6 +172,8 @@ def simulate_user(user_id, start_time):
     
     print(f"[User {user_id}] Started")
     
+    # One pooled keep-alive session per user, like a browser tab
+    session = create_session(keepalive=KEEPALIVE)
     message_count = 0
     
     while time.time() - start_time < TEST_DURATION and message_count < MESSAGES_PER_USER:
@@ -158,19 +192,33 @@ def simulate_user(user_id, start_time):
             
             stats.record_sent(user_id)
             request_start = time.time()
+            timer = PhaseTimer()
             
             # Send request with streaming
-            response = requests.post(
+            response = session.post(
                 f"{BASE_URL}/v1/chat/completions",
                 headers={"Content-Type": "application/json"},
                 json=payload,
                 stream=True,
                 timeout=60
             )
+            timer.headers_received()
+            if timer.new_connection():
+                stats.record_connection()
+            
+            if response.status_code == 429:
+                # Shed by gateway admission control; honour Retry-After
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                print(f"[User {user_id}] Rejected (429), retry after {retry_after:g}s")
+                stats.record_rejected(user_id)
+                response.content  # drain the short error body so the connection is reused
+                time.sleep(retry_after)
+                continue
             
             if response.status_code != 200:
                 print(f"[User {user_id}] HTTP {response.status_code}")
-                stats.record_failed(user_id, 'connection')
+                stats.record_failed(user_id, 'connection', response.headers.get('X-Upstream-Addr'))
+                response.content  # drain the short error body so the connection is reused
                 time.sleep(random.uniform(*DELAY_BETWEEN_MESSAGES))
                 continue
             
@@ -184,7 +232,9 @@ def simulate_user(user_id, start_time):
                     if line.startswith("data: "):
                         data = line[6:]
                         if data == "[DONE]":
-                            break
+                            # Keep reading to the end of the body so the
+                            # connection is returned to the pool
+                            continue
                         
                         try:
                             parsed = json.loads(data)
@@ -194,6 +244,7 @@ def simulate_user(user_id, start_time):
                                 content = delta.get('content', '')
                                 
                                 if content:
+                                    timer.token()
                                     full_response += content
                                     token_count += 1
                         except json.JSONDecodeError:
@@ -202,11 +253,13 @@ def simulate_user(user_id, start_time):
             response_time = time.time() - request_start
             
             if full_response:
-                stats.record_completed(user_id, response_time, token_count)
+                phases = timer.phases()
+                stats.record_completed(user_id, response_time, token_count, phases,
+                                       response.headers.get('X-Upstream-Addr'))
                 message_count += 1
-                print(f"[User {user_id}] Message {message_count}/{MESSAGES_PER_USER} - {response_time:.2f}s - {token_count} tokens")
+                print(f"[User {user_id}] Message {message_count}/{MESSAGES_PER_USER} - {response_time:.2f}s - {token_count} tokens - {format_phases(phases)}")
             else:
-                stats.record_failed(user_id, 'streaming')
+                stats.record_failed(user_id, 'streaming', response.headers.get('X-Upstream-Addr'))
                 print(f"[User {user_id}] Empty response")
             
             # Wait before next message
@@ -222,6 +275,7 @@ def simulate_user(user_id, start_time):
             print(f"[User {user_id}] Error: {e}")
             time.sleep(5)
     
+    session.close()
     stats.decrement_active()
     print(f"[User {user_id}] Finished - Sent {message_count} messages")
 
@@ -246,6 +300,7 @@ def print_stats_periodic():
         print(f"Avg Tokens/Msg:     {summary['avg_tokens']:.0f}")
         print(f"Connection Errors:  {summary['connection_errors']}")
         print(f"Streaming Errors:   {summary['streaming_errors']}")
+        print(f"Rejected (429):     {summary['rejected']}")
         
         if summary['percentiles']:
             print(f"\nResponse Time Percentiles:")
@@ -254,6 +309,10 @@ def print_stats_periodic():
             print(f"  P95:          {summary['percentiles']['p95']:.2f}s")
             print(f"  P99:          {summary['percentiles']['p99']:.2f}s")
         
+        print_phase_breakdown(summary['phases'], summary['connections_opened'], summary['messages_sent'])
+        print()
+        print_goodput_line(stats.slo.report())
+        
         print(f"{'='*70}\n")
 
 def main():
@@ -265,6 +324,8 @@ def main():
     print(f"Users:         {NUM_USERS}")
     print(f"Duration:      {TEST_DURATION}s ({TEST_DURATION//60} minutes)")
     print(f"Msgs/User:     {MESSAGES_PER_USER}")
+    print(f"Keep-Alive:    {'on' if KEEPALIVE else 'off'}")
+    print(f"SLOs:          TTFT <= {SLO_TTFT * 1000:.0f}ms, TPOT <= {SLO_TPOT * 1000:.0f}ms, E2E <= {SLO_E2E}s")
     print(f"{'='*70}\n")
     
     # Test connection first
@@ -277,6 +338,8 @@ def main():
     time.sleep(3)
     
     start_time = time.time()
+    # Goodput is measured from here, not from import (connection test, start delay)
+    stats.slo.start_time = start_time
     
     # Start statistics thread
     stats_thread = threading.Thread(target=print_stats_periodic, daemon=True)
@@ -312,6 +375,7 @@ def main():
     print(f"")
     print(f"Connection Errors:  {summary['connection_errors']}")
     print(f"Streaming Errors:   {summary['streaming_errors']}")
+    print(f"Rejected (429):     {summary['rejected']}")
     
     if summary['percentiles']:
         print(f"\nResponse Time Percentiles:")
@@ -320,6 +384,8 @@ def main():
         print(f"  P95:          {summary['percentiles']['p95']:.2f}s")
         print(f"  P99:          {summary['percentiles']['p99']:.2f}s")
     
+    print_phase_breakdown(summary['phases'], summary['connections_opened'], summary['messages_sent'])
+    
     # Throughput calculations
     if summary['messages_completed'] > 0:
         duration = time.time() - start_time
@@ -327,6 +393,8 @@ def main():
         print(f"\nThroughput:         {throughput:.2f} messages/second")
         print(f"Tokens/second:      {(summary['avg_tokens'] * throughput):.0f}")
     
+    print_slo_report(stats.slo.report())
+    
     print(f"{'='*70}\n")
 
 if __name__ == "__main__":